@@ -0,0 +1,164 @@
+"""Persistent cache of evaluate results.
+
+An evaluation is keyed on the policy class and get_params (which includes the seed of a
+RandomPolicy), the rows the evaluation visits (policies.get_day_runs), v0, and a fingerprint of the data: a hash of
+the index and of the columns the evaluation reads, the next day pdiff labels and the
+policy's get_data_columns. The hash is computed on every lookup, so new preprocessed
+data or a column overwritten in place (i.e, add_index_performance with another
+weighting) never gets an old result, old results just age out.
+
+Each result is one small npz file with the value path and the picks as codes into the
+distinct picks. The least recently used files are evicted once the cache is over
+max_mb.
+
+Policies whose get_params is None (i.e, an unseeded RandomPolicy) are not cached.
+"""
+
+import glob
+import hashlib
+import json
+import os
+from logging import getLogger, basicConfig, INFO
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+import numpy as np
+import pandas as pd
+from pandas.core.util.hashing import hash_pandas_object
+
+import daytradeai.policies as policies
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+EVICT_TO = 0.9  # of max_mb, so a full cache is not rescanned on every put
+
+
+def get_data_fingerprint(df: pd.DataFrame, columns: Optional[List[str]] = None) -> str:
+    """hash of the index, and the names and values of columns (all if None)"""
+    if columns is not None:
+        df = cast(pd.DataFrame, df[columns])
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def get_evaluated_columns(
+    df: pd.DataFrame, policy: policies.Policy
+) -> Optional[List[str]]:
+    """columns an evaluation of policy reads, None for all"""
+    policy_cols = policy.get_data_columns()
+    if policy_cols is None:
+        return None
+    label_cols = [
+        col
+        for col in df.columns
+        if col.startswith("label_") and col.endswith("_pdiff_1f")
+    ]
+    return sorted(set(label_cols) | set(policy_cols))
+
+
+class BacktestCache:
+    def __init__(self, cache_dir: str, max_mb: float = 512):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 2**20)
+        # this process' view of the size, rescanned on evict
+        self.total_bytes: Optional[int] = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> "BacktestCache":
+        return cls(cache_dir=cfg["cache_dir"], max_mb=cfg["max_mb"])
+
+    def get_key(
+        self,
+        df: pd.DataFrame,
+        policy: policies.Policy,
+        start_iloc: int,
+        end_iloc: int,
+        v0: float,
+    ) -> Optional[str]:
+        """None if the policy's picks are not reproducible"""
+        params = policy.get_params()
+        if params is None:
+            return None
+        key = dict(
+            policy=f"{type(policy).__module__}.{type(policy).__qualname__}",
+            params=params,
+            days=policies.get_day_runs(start_iloc, end_iloc, num_days=len(df)),
+            v0=v0,
+            data=get_data_fingerprint(df, columns=get_evaluated_columns(df, policy)),
+        )
+        encoded = json.dumps(key, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key: str) -> Optional[Tuple[List[float], List[str]]]:
+        path = self.get_path(key)
+        try:
+            with np.load(path) as result:
+                vals = result["vals"].tolist()
+                stocks = result["stock_names"][result["stock_codes"]].tolist()
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        os.utime(path)  # most recently used
+        return vals, stocks
+
+    def put(self, key: str, vals: List[float], stocks: List[str]) -> None:
+        stock_names, stock_codes = np.unique(
+            np.array(stocks, dtype=str), return_inverse=True
+        )
+        path = self.get_path(key)
+        with open(path + ".tmp", "wb") as fh:
+            np.savez(
+                fh,
+                vals=np.asarray(vals, dtype=np.float64),
+                stock_names=stock_names,
+                stock_codes=stock_codes.astype(np.int32),
+            )
+        os.replace(path + ".tmp", path)
+        if self.total_bytes is None:
+            self.total_bytes = self.get_total_bytes()
+        else:
+            self.total_bytes += os.path.getsize(path)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def get_total_bytes(self) -> int:
+        return sum(
+            os.path.getsize(path)
+            for path in glob.glob(os.path.join(self.cache_dir, "*.npz"))
+        )
+
+    def evict(self) -> None:
+        """removes least recently used results until the cache is EVICT_TO of max_mb"""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= EVICT_TO * self.max_bytes:
+                break
+            logger.debug(f"Evicting backtest result {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def clear(self) -> None:
+        for path in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            os.remove(path)
+        self.total_bytes = 0
@@ -23,12 +23,56 @@ cfg_preprocess: Dict[str, Any] = dict(
         0: [1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 60, 90, 120, 150, 180, 210, 240],
         1: [1],
     },
+    # also available: rolling window features, see preprocess.ROLLING_FEATS
     lag_feats=["diff", "pdiff", "lag"],
     index_name=cfg_data["stocks"] + "_avg",
+    index_weighting="equal",  # index for the labels, see indices.INDEX_WEIGHTINGS
+    index_halflife=60,  # days, for invvol weighting
     data_dir="/Users/davidschneider/data/daytradeai/prd/preprocessed",
+    # process tickers in groups that fit in memory_budget_mb, for large universes
+    out_of_core=False,
+    memory_budget_mb=2048,
+    # in memory preprocessing saves versions as deltas, see snapshots.py
+    snapshots=dict(compact_every=20, retain_versions=60),
 )
 
-cfg = dict(data=cfg_data, preprocess=cfg_preprocess)
+cfg_screening: Dict[str, Any] = dict(
+    top_k=200,  # features passed to training
+    sort_by="mi",  # or pb_corr, fold_corr_mean, sign_stability
+    holdout_days=250,  # last days, backtested in visualize and evaluate, not screened or trained on
+    num_bins=10,
+    num_folds=5,
+    chunk_size=256,  # feature columns per matrix chunk
+)
+
+cfg_model: Dict[str, Any] = dict(
+    model_dir="/Users/davidschneider/data/daytradeai/prd/models",
+)
+
+cfg_serve: Dict[str, Any] = dict(
+    host="127.0.0.1",
+    port=8765,
+    listen_backlog=128,  # pending connections, concurrent clients beyond it are reset
+    max_batch=512,  # rows (tickers) per model call
+    max_wait_ms=2.0,  # how long a batch waits for more requests
+    num_days=5,  # latest days kept in memory, requests can ask for any of them
+    reload_interval_s=30.0,  # checks for a new model or preprocessed data
+    request_timeout_s=10.0,
+)
+
+cfg_cache: Dict[str, Any] = dict(
+    cache_dir="/Users/davidschneider/data/daytradeai/prd/backtest_cache",
+    max_mb=512,  # least recently used results are evicted beyond this
+)
+
+cfg = dict(
+    data=cfg_data,
+    preprocess=cfg_preprocess,
+    screening=cfg_screening,
+    model=cfg_model,
+    serve=cfg_serve,
+    cache=cfg_cache,
+)
 
 cfg_dbg = cfg.copy()
 cfg_dbg["data"] = cfg_data_dbg
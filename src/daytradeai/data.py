@@ -1,9 +1,10 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import os
 import glob
 from logging import getLogger, basicConfig, INFO
 
 import pandas as pd
+import pyarrow.parquet as pq
 import yfinance as yf
 
 from daytradeai.stocks import get_tickers
@@ -23,6 +24,13 @@ def get_stock_download_dir(cfg: Dict[str, str]) -> str:
     return loc
 
 
+def get_downloaded_files(stock_download_dir: str) -> List[str]:
+    """downloaded files, newest first. Files are named by their latest day, so where files
+    overlap the newest download wins.
+    """
+    return sorted(glob.glob(os.path.join(stock_download_dir, "*.parquet")), reverse=True)
+
+
 def get_downloaded_data(cfg: Dict[str, str]) -> pd.DataFrame:
     """returns all downloaded data (if any) as a single dataframe
 
@@ -34,21 +42,63 @@ def get_downloaded_data(cfg: Dict[str, str]) -> pd.DataFrame:
     """
 
     stock_download_dir = get_stock_download_dir(cfg=cfg)
-    timestamped_files = glob.glob(os.path.join(stock_download_dir, "*.parquet"))
+    timestamped_files = get_downloaded_files(stock_download_dir)
 
     if timestamped_files:
         logger.info(f"Reading {len(timestamped_files)} files from {stock_download_dir}")
-        df = pd.read_parquet(timestamped_files.pop())
-        for fname in timestamped_files:
+        df = pd.read_parquet(timestamped_files[0])
+        for fname in timestamped_files[1:]:
             df = df.combine_first(pd.read_parquet(fname))
         return df
     logger.warning(f"No files found in {stock_download_dir}")
     return pd.DataFrame()
 
 
+def get_downloaded_index(cfg: Dict[str, str]) -> pd.DatetimeIndex:
+    """returns the sorted union of the dates in all downloaded files, without reading any
+    price columns
+    """
+    stock_download_dir = get_stock_download_dir(cfg=cfg)
+    index = pd.DatetimeIndex([])
+    for fname in get_downloaded_files(stock_download_dir):
+        index = index.union(pd.read_parquet(fname, columns=[]).index)
+    return index.sort_values()
+
+
+def get_downloaded_prices(
+    cfg: Dict[str, str], price: str, tickers: List[str]
+) -> pd.DataFrame:
+    """returns one price field for some tickers from all downloaded files, reading only
+    those columns. Same values as get_downloaded_data(cfg)[price][tickers].
+
+    Args:
+        cfg (Dict[str, str]): data configuration
+        price (str): price field, i.e, Open
+        tickers (List[str]): tickers to read
+
+    Returns:
+        pd.DataFrame: one column per ticker (missing tickers are left out), sorted by date
+    """
+    stock_download_dir = get_stock_download_dir(cfg=cfg)
+    df = pd.DataFrame()
+    for fname in get_downloaded_files(stock_download_dir):
+        # yfinance columns are (Price, Ticker), parquet stores them as the tuple string
+        available = set(pq.read_schema(fname).names)
+        columns = [str((price, ticker)) for ticker in tickers]
+        columns = [col for col in columns if col in available]
+        df_file = pd.read_parquet(fname, columns=columns)
+        df_file.columns = [
+            col[1] if isinstance(col, tuple) else col for col in df_file.columns
+        ]
+        df = df_file if df.empty else df.combine_first(df_file)
+    if df.empty:
+        logger.warning(f"No {price} prices for {tickers} found in {stock_download_dir}")
+    return df.sort_index()
+
+
 def get_new_data(cfg: Dict[str, Any], df_current: pd.DataFrame) -> pd.DataFrame:
     tickers = yf.Tickers(get_tickers(cfg["stocks"], num_tickers=cfg["num_tickers"]))
-    if df_current.empty:
+    if len(df_current.index) == 0:
         logger.info("Fetching new data from scratch")
         df_new = tickers.history(period=cfg["period"], interval=cfg["interval"])
         df_new = df_new.dropna() if df_new is not None else pd.DataFrame()
@@ -1,39 +1,65 @@
 import pandas as pd
-from typing import List, Tuple
+from functools import partial
+from typing import Callable, List, Optional, Tuple
 
+import daytradeai.cache as cache
+import daytradeai.indices as indices
 import daytradeai.policies as policies
+import daytradeai.shared as shared
 
 
-def get_index_perf(df: pd.DataFrame, stocks: List[str]) -> pd.Series:
+def get_index_perf(
+    df: pd.DataFrame,
+    stocks: List[str],
+    weighting: str = "equal",
+    group: Optional[str] = None,
+    halflife: float = 60,
+) -> pd.Series:
     """index performance is from equally weighted investment in each stock, for
-    one day.
+    one day. Other weightings are in indices.py.
 
     Args:
-        df (pd.DataFrame): contains 1d pdiff performance for each stock
+        df (pd.DataFrame): contains 1d pdiff performance for each stock, and prices
+            for weightings other than equal
         stocks (List[str]): stocks to average
+        weighting (str, optional): one of indices.INDEX_WEIGHTINGS. Defaults to "equal".
+        group (Optional[str], optional): stock group, for cap weights. Defaults to None.
+        halflife (float, optional): days, for invvol weights. Defaults to 60.
 
     Returns:
-        pd.Series: _description_
+        pd.Series: next day pdiff of the index
     """
+    if weighting != "equal":
+        return indices.get_index_performance(
+            df, stocks=stocks, weighting=weighting, group=group or "", halflife=halflife
+        )
     cols = [f"label_{stock}_pdiff_1f" for stock in stocks]
     return df[cols].mean(axis=1)
 
 
 def add_index_performance(
-    df: pd.DataFrame, stocks: List[str], index_name: str
+    df: pd.DataFrame,
+    stocks: List[str],
+    index_name: str,
+    weighting: str = "equal",
+    group: Optional[str] = None,
+    halflife: float = 60,
 ) -> pd.DataFrame:
     """adds the column label_{index_name}_pdiff_1f to the dataframe with
-    the index performance.
+    the index performance, the benchmark for ControlPolicy(index_name).
 
     Args:
         df (pd.DataFrame): contains stock performance
         stocks (List[str]): stocks to average
         index_name (str): 'stock name' fo average
+        weighting, group, halflife: see get_index_perf
 
     Returns:
         pd.DataFrame: modifies df, adds column
     """
-    df[f"label_{index_name}_pdiff_1f"] = get_index_perf(df=df, stocks=stocks)
+    df[f"label_{index_name}_pdiff_1f"] = get_index_perf(
+        df=df, stocks=stocks, weighting=weighting, group=group, halflife=halflife
+    )
     return df
 
 
@@ -63,6 +89,7 @@ def get_asset_values_and_stocks(
     end_iloc: int,
     policy: policies.Policy,
     v0: float = 1.0,
+    backtest_cache: Optional[cache.BacktestCache] = None,
 ) -> Tuple[List[float], List[str]]:
     """starting with v0 prior to start_day, asks policy for the next stock to buy each day until end_day.
     Returns list of value changes and stocks picked.
@@ -72,11 +99,25 @@ def get_asset_values_and_stocks(
         start_iloc, end_iloc: these are integer location values into df for the days to use.
         policy (policies.Policy): returns stock pick for that iloc
         v0 (float, optional): initial value. Defaults to 1.0.
+        backtest_cache (Optional[cache.BacktestCache], optional): returns a previous result
+            for the same policy, params, days and data, otherwise evaluates the policy from
+            its reset state and stores the result. Defaults to None.
 
     Returns:
         Tuple[List[float], List[str]]: list of values and stocks. There will be one less value in stocks
         than values
     """
+    key = None
+    if backtest_cache is not None:
+        key = backtest_cache.get_key(
+            df=df, policy=policy, start_iloc=start_iloc, end_iloc=end_iloc, v0=v0
+        )
+        if key is not None:
+            result = backtest_cache.get(key)
+            if result is not None:
+                return result
+            policy.reset()
+
     vals = [v0]
     stocks = []
 
@@ -85,6 +126,8 @@ def get_asset_values_and_stocks(
         vals.append(v)
         stocks.append(stock)
 
+    if backtest_cache is not None and key is not None:
+        backtest_cache.put(key, vals=vals, stocks=stocks)
     return vals, stocks
 
 
@@ -94,7 +137,63 @@ def get_asset_final_value(
     end_iloc: int,
     policy: policies.Policy,
     val: float = 1.0,
+    backtest_cache: Optional[cache.BacktestCache] = None,
 ) -> float:
+    if backtest_cache is not None:
+        vals, _ = get_asset_values_and_stocks(
+            df=df,
+            start_iloc=start_iloc,
+            end_iloc=end_iloc,
+            policy=policy,
+            v0=val,
+            backtest_cache=backtest_cache,
+        )
+        return vals[-1]
     for iloc in range(start_iloc, end_iloc + 1):
         val, _ = get_next_value_and_stock(df=df, iloc=iloc, policy=policy, v=val)
     return val
+
+
+def get_asset_final_values_parallel(
+    dataset: shared.SharedDataset,
+    start_iloc: int,
+    end_iloc: int,
+    make_policy: Callable[[pd.DataFrame], policies.Policy],
+    num_runs: int,
+    num_workers: Optional[int] = None,
+) -> List[float]:
+    """final value of num_runs evaluations, spread over worker processes that share one
+    copy of the data.
+
+    Args:
+        dataset (shared.SharedDataset): preprocessed data in shared memory
+        start_iloc, end_iloc: these are integer location values into df for the days to use.
+        make_policy (Callable[[pd.DataFrame], policies.Policy]): builds the policy for a run
+            from the worker's view of the data, must be picklable (module level function)
+        num_runs (int): number of evaluations, e.g. of a random policy
+        num_workers (Optional[int], optional): processes. Defaults to os.cpu_count().
+
+    Returns:
+        List[float]: final value for each run
+    """
+    run = partial(
+        get_run_final_value,
+        start_iloc=start_iloc,
+        end_iloc=end_iloc,
+        make_policy=make_policy,
+    )
+    return shared.pool_map(
+        dataset=dataset, fn=run, args=range(num_runs), num_workers=num_workers
+    )
+
+
+def get_run_final_value(
+    df: pd.DataFrame,
+    run: int,
+    start_iloc: int,
+    end_iloc: int,
+    make_policy: Callable[[pd.DataFrame], policies.Policy],
+) -> float:
+    return get_asset_final_value(
+        df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=make_policy(df)
+    )
@@ -0,0 +1,210 @@
+"""Index construction: how the stocks are weighted in the index the labels and the control
+policy compare against.
+
+    equal   same investment in every stock (and cash), the original index
+    cap     market cap weighted, the Weight fields in stocks.py taken as the cap weights on
+            the last day and drifting with price before that
+    price   price weighted, like the DJIA
+    invvol  inverse volatility, 1 / exponentially weighted std of daily pdiff up to that
+            day. Cash has no volatility and is left out.
+
+Weights on day t only use prices up to day t and are applied to the pdiff from t to t+1.
+"""
+
+from logging import getLogger, basicConfig, INFO
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from daytradeai.stocks import get_ticker_weights
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+INDEX_WEIGHTINGS = ["equal", "cap", "price", "invvol"]
+
+
+class EWCovariance:
+    """exponentially weighted mean and covariance of a stream of vectors, one O(N^2) update
+    per observation. Same values as pandas ewm(alpha, adjust=False).cov(bias=True). The
+    state can be saved and loaded to resume where a previous run stopped.
+    """
+
+    def __init__(self, num_assets: int, halflife: float):
+        self.halflife = halflife
+        self.alpha = 1.0 - 0.5 ** (1.0 / halflife)
+        self.mean = np.zeros(num_assets)
+        self.cov = np.zeros((num_assets, num_assets))
+        self.num_updates = 0
+        self.last_date: Optional[pd.Timestamp] = None
+
+    def update(self, x: np.ndarray, date: Optional[pd.Timestamp] = None) -> None:
+        """adds one observation. NaN entries are taken to be at the current mean, so they
+        only decay that asset's (co)variances.
+        """
+        x = np.where(np.isnan(x), self.mean, x)
+        if self.num_updates == 0:
+            self.mean = x.astype(np.float64)
+        else:
+            diff = x - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.cov = (1.0 - self.alpha) * (self.cov + np.outer(diff, incr))
+        self.num_updates += 1
+        self.last_date = date
+
+    def get_volatility(self) -> np.ndarray:
+        return np.sqrt(np.diag(self.cov))
+
+    def save(self, path: str) -> None:
+        last_date = "" if self.last_date is None else self.last_date.isoformat()
+        np.savez(
+            path,
+            halflife=self.halflife,
+            mean=self.mean,
+            cov=self.cov,
+            num_updates=self.num_updates,
+            last_date=last_date,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EWCovariance":
+        state = np.load(path)
+        engine = cls(num_assets=len(state["mean"]), halflife=float(state["halflife"]))
+        engine.mean = state["mean"]
+        engine.cov = state["cov"]
+        engine.num_updates = int(state["num_updates"])
+        last_date = str(state["last_date"])
+        engine.last_date = pd.Timestamp(last_date) if last_date else None
+        return engine
+
+
+def get_ew_volatility(
+    returns: pd.DataFrame, halflife: float, engine: Optional[EWCovariance] = None
+) -> pd.DataFrame:
+    """EW volatility of each column after each day. With an engine from a checkpoint, only
+    the days after engine.last_date are streamed and returned, and the engine is left at the
+    last day so it can be saved again.
+    """
+    if engine is None:
+        engine = EWCovariance(num_assets=returns.shape[1], halflife=halflife)
+    if engine.last_date is not None:
+        returns = returns[returns.index > engine.last_date]
+    vols = np.full(returns.shape, np.nan)
+    values = returns.to_numpy(dtype=np.float64)
+    for idx, date in enumerate(returns.index):
+        engine.update(values[idx], date=date)
+        vols[idx] = engine.get_volatility()
+    return pd.DataFrame(vols, index=returns.index, columns=returns.columns)
+
+
+def get_pdiff_1d(prices: pd.DataFrame) -> pd.DataFrame:
+    past = prices.shift(1)
+    return 100.0 * (prices - past) / past
+
+
+def get_cap_weights(group: str) -> Dict[str, float]:
+    if not group:
+        raise ValueError("group is required for cap weighting, for the Weight fields")
+    return get_ticker_weights(group)
+
+
+def check_cap_weights(stocks: List[str], group: str) -> None:
+    """raises ValueError if no stock of the index has a listed weight, the index would have
+    no value. Warns about the stocks (but cash) left out of it.
+    """
+    cap_weights = get_cap_weights(group)
+    if not any(stock in cap_weights for stock in stocks):
+        raise ValueError(
+            f"No stock has a Weight field in group {group}, it can not be cap weighted"
+        )
+    left_out = [stock for stock in stocks if stock not in cap_weights and stock != "cash"]
+    if left_out:
+        logger.warning(
+            f"No Weight field in group {group}, left out of the index: {left_out}"
+        )
+
+
+def get_index_weights(
+    prices: pd.DataFrame,
+    stocks: List[str],
+    weighting: str,
+    group: str,
+    halflife: float = 60,
+) -> pd.DataFrame:
+    """unnormalized index weight of each stock on each day.
+
+    Args:
+        prices (pd.DataFrame): one column per stock (cash is a constant 1.0)
+        stocks (List[str]): stocks in the index
+        weighting (str): one of INDEX_WEIGHTINGS
+        group (str): stock group, for the cap weights
+        halflife (float, optional): days, for invvol. Defaults to 60.
+
+    Returns:
+        pd.DataFrame: days x stocks, 0 where a stock is not in the index that day
+    """
+    prices = prices[stocks]
+    if weighting == "equal":
+        weights = pd.DataFrame(1.0, index=prices.index, columns=stocks)
+    elif weighting == "price":
+        weights = prices.copy()
+    elif weighting == "cap":
+        cap_weights = get_cap_weights(group)
+        last_prices = prices.ffill().iloc[-1]
+        scale = pd.Series(
+            {stock: cap_weights.get(stock, 0.0) for stock in stocks}
+        ) / last_prices.where(last_prices > 0)
+        weights = prices * scale
+    elif weighting == "invvol":
+        vols = get_ew_volatility(get_pdiff_1d(prices), halflife=halflife)
+        # left out until there is a volatility estimate, and always for cash
+        weights = 1.0 / vols.where(vols > 0)
+    else:
+        raise ValueError(
+            f"Unknown index weighting {weighting}, must be one of {INDEX_WEIGHTINGS}"
+        )
+    return weights.fillna(0.0)
+
+
+def get_weighted_pdiff_1f(
+    prices: pd.DataFrame,
+    stocks: List[str],
+    weighting: str,
+    group: str,
+    halflife: float = 60,
+) -> Dict[str, pd.Series]:
+    """sum of weight * next day pdiff, and of the weights of the stocks that have one. The
+    index performance is their ratio; sums from groups of stocks can be added up first.
+    """
+    pdiff_1f = get_pdiff_1d(prices[stocks]).shift(-1)
+    weights = get_index_weights(
+        prices, stocks=stocks, weighting=weighting, group=group, halflife=halflife
+    )
+    weights = weights.where(pdiff_1f.notna(), 0.0)
+    return dict(
+        weighted_sum=(weights * pdiff_1f.fillna(0.0)).sum(axis=1),
+        weight=weights.sum(axis=1),
+    )
+
+
+def get_index_performance(
+    prices: pd.DataFrame,
+    stocks: List[str],
+    weighting: str,
+    group: str,
+    halflife: float = 60,
+) -> pd.Series:
+    """next day pdiff of the index, what label_{ticker}_pdiff_1f is compared against"""
+    if weighting == "cap":
+        check_cap_weights(stocks, group=group)
+    sums = get_weighted_pdiff_1f(
+        prices, stocks=stocks, weighting=weighting, group=group, halflife=halflife
+    )
+    return sums["weighted_sum"] / sums["weight"].where(sums["weight"] > 0)
@@ -0,0 +1,178 @@
+"""Loops for stateful, path-dependent policies over NumPy arrays.
+
+A step function picks the stock index for one day from the policy state, that day's
+scores (one per stock) and the policy parameters:
+
+    step(state: np.ndarray, scores: np.ndarray, params: np.ndarray) -> int
+
+The state is a small float array, see the *_IDX constants. It is updated by the loop, not
+the step function: switching stocks resets it, each day's return is then applied to it.
+Step functions must only use what numba supports in nopython mode. When numba is
+installed the step and the loops are compiled, otherwise the same code runs as Python.
+"""
+
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit as numba_njit
+
+    HAVE_NUMBA = True
+except ImportError:  # optional accelerator
+    numba_njit = None
+    HAVE_NUMBA = False
+
+
+def njit(fn: Callable) -> Callable:
+    """fn compiled in nopython mode, or fn itself without numba"""
+    if numba_njit is None:
+        return fn
+    return numba_njit(fn)
+
+
+HOLDING_IDX = 0  # index of the stock held, -1 before the first pick
+DAYS_HELD_IDX = 1  # days the current stock has been held
+GROWTH_IDX = 2  # value ratio since the current stock was bought
+STATE_SIZE = 3
+
+
+def init_state() -> np.ndarray:
+    state = np.zeros(STATE_SIZE)
+    state[HOLDING_IDX] = -1
+    state[GROWTH_IDX] = 1.0
+    return state
+
+
+def enter_position(state: np.ndarray, pick: int) -> None:
+    if pick != int(state[HOLDING_IDX]):
+        state[HOLDING_IDX] = pick
+        state[DAYS_HELD_IDX] = 0
+        state[GROWTH_IDX] = 1.0
+
+
+def apply_return(state: np.ndarray, ratio: float) -> None:
+    state[DAYS_HELD_IDX] += 1
+    state[GROWTH_IDX] *= ratio
+
+
+def argmax_finite(x: np.ndarray, skip: int = -1) -> int:
+    """index of the largest non-NaN value, ignoring index skip. 0 if there is none."""
+    best = -1
+    for idx in range(len(x)):
+        if idx == skip or np.isnan(x[idx]):
+            continue
+        if best < 0 or x[idx] > x[best]:
+            best = idx
+    return max(best, 0)
+
+
+def hold_step(state: np.ndarray, scores: np.ndarray, params: np.ndarray) -> int:
+    """best scoring stock, but keep each pick for at least params[0] days"""
+    holding = int(state[HOLDING_IDX])
+    if holding >= 0 and state[DAYS_HELD_IDX] < params[0]:
+        return holding
+    return argmax_finite(scores)
+
+
+def stop_loss_step(state: np.ndarray, scores: np.ndarray, params: np.ndarray) -> int:
+    """keep the current stock until it is down params[0] percent since it was bought, then
+    switch to the best scoring other stock
+    """
+    holding = int(state[HOLDING_IDX])
+    if holding < 0:
+        return argmax_finite(scores)
+    if state[GROWTH_IDX] < 1.0 - params[0] / 100.0:
+        return argmax_finite(scores, holding)
+    return holding
+
+
+def switch_margin_step(state: np.ndarray, scores: np.ndarray, params: np.ndarray) -> int:
+    """switch to the best scoring stock only if its score beats the current stock's by
+    params[0] (in the units of the score, percent for pdiff features)
+    """
+    best = argmax_finite(scores)
+    holding = int(state[HOLDING_IDX])
+    if holding < 0 or np.isnan(scores[holding]):
+        return best
+    if scores[best] > scores[holding] + params[0]:
+        return best
+    return holding
+
+
+def run_policy(
+    step: Callable,
+    scores: np.ndarray,
+    returns: np.ndarray,
+    params: np.ndarray,
+    start: int,
+    end: int,
+    v0: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """value path and picks for days start..end (inclusive, non-negative).
+
+    Args:
+        step (Callable): step function
+        scores (np.ndarray): days x stocks, what the step function ranks
+        returns (np.ndarray): days x stocks, next day percent change (label_*_pdiff_1f)
+        params (np.ndarray): step function parameters
+        start, end (int): first and last day
+        v0 (float): initial value
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: values (one more than days) and stock indices
+    """
+    num_days = end - start + 1
+    vals = np.empty(num_days + 1)
+    picks = np.empty(num_days, dtype=np.int64)
+    vals[0] = v0
+    state = init_state()
+    for day in range(num_days):
+        iloc = start + day
+        pick = step(state, scores[iloc], params)
+        enter_position(state, pick)
+        ratio = 1.0 + returns[iloc, pick] / 100.0
+        vals[day + 1] = vals[day] * ratio
+        picks[day] = pick
+        apply_return(state, ratio)
+    return vals, picks
+
+
+if HAVE_NUMBA:
+    init_state = njit(init_state)
+    enter_position = njit(enter_position)
+    apply_return = njit(apply_return)
+    argmax_finite = njit(argmax_finite)
+    compiled_run_policy = njit(run_policy)
+else:
+    compiled_run_policy = run_policy
+
+
+def run_policy_grid(
+    step: Callable,
+    scores: np.ndarray,
+    returns: np.ndarray,
+    param_grid: np.ndarray,
+    start: int,
+    end: int,
+    v0: float,
+) -> np.ndarray:
+    """final value for each row of param_grid, see run_policy"""
+    finals = np.empty(len(param_grid))
+    for idx in range(len(param_grid)):
+        vals, _ = compiled_run_policy(
+            step, scores, returns, param_grid[idx], start, end, v0
+        )
+        finals[idx] = vals[-1]
+    return finals
+
+
+compiled_run_policy_grid = njit(run_policy_grid) if HAVE_NUMBA else run_policy_grid
+
+_compiled_steps: Dict[Callable, Callable] = dict()
+
+
+def get_compiled_step(step: Callable) -> Callable:
+    if step not in _compiled_steps:
+        _compiled_steps[step] = njit(step)
+    return _compiled_steps[step]
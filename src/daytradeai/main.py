@@ -1,8 +1,13 @@
-from typing import Any, Dict
+from typing import Any, Dict, List
 from logging import getLogger, basicConfig, INFO
+import pandas as pd
+import pyarrow.parquet as pq
 import daytradeai.data as data
 import daytradeai.config as config
+import daytradeai.models as models
 import daytradeai.preprocess as preprocess
+import daytradeai.screening as screening
+from daytradeai.stocks import get_tickers
 
 
 basicConfig(
@@ -15,6 +20,9 @@ logger = getLogger(__name__)
 
 def main(cfg: Dict[str, Any]) -> None:
     logger.info("Starting main process")
+    if cfg["preprocess"].get("out_of_core", False):
+        main_out_of_core(cfg=cfg)
+        return
     df_current = data.get_downloaded_data(cfg=cfg["data"])
     df_new = data.get_new_data(cfg=cfg["data"], df_current=df_current)
     data.save_downloaded_data(df=df_new, cfg=cfg["data"])
@@ -23,15 +31,61 @@ def main(cfg: Dict[str, Any]) -> None:
         df=df_raw, data_cfg=cfg["data"], preprocess_cfg=cfg["preprocess"]
     )
     preprocess.save_preprocessed(df=df_preprocessed, cfg=cfg["preprocess"])
-    model = train_model()
+    # screening and training stay out of the holdout days the backtests run on
+    rows = screening.get_screening_rows(len(df_preprocessed), cfg["screening"])
+    ranking = screening.screen_features(
+        df=df_preprocessed,
+        tickers=get_tickers(group=cfg["data"]["stocks"]) + ["cash"],
+        screening_cfg=cfg["screening"],
+        rows=rows,
+    )
+    screening.save_feature_ranking(ranking=ranking, cfg=cfg["preprocess"])
+    feature_cols = screening.get_top_features(ranking, top_k=cfg["screening"]["top_k"])
+    model = train_model(
+        df=df_preprocessed.iloc[rows],
+        tickers=get_tickers(group=cfg["data"]["stocks"]) + ["cash"],
+        feature_cols=feature_cols,
+    )
     evaluate_model(model)
-    save_model(model)
+    save_model(model, cfg=cfg["model"])
     logger.info("Main process completed")
 
 
-def train_model():
+def main_out_of_core(cfg: Dict[str, Any]) -> None:
+    """like main, but never holds all the raw or preprocessed data in memory"""
+    df_current = pd.DataFrame(index=data.get_downloaded_index(cfg=cfg["data"]))
+    df_new = data.get_new_data(cfg=cfg["data"], df_current=df_current)
+    data.save_downloaded_data(df=df_new, cfg=cfg["data"])
+    output_dir = preprocess.preprocess_data_out_of_core(
+        data_cfg=cfg["data"], preprocess_cfg=cfg["preprocess"]
+    )
+    tickers = get_tickers(group=cfg["data"]["stocks"]) + ["cash"]
+    parts = preprocess.get_preprocessed_parts(output_dir)
+    rows = screening.get_screening_rows(
+        pq.read_metadata(parts[0]).num_rows, cfg["screening"]
+    )
+    ranking = screening.screen_feature_parts(
+        parts=parts, tickers=tickers, screening_cfg=cfg["screening"], rows=rows
+    )
+    screening.save_feature_ranking(ranking=ranking, cfg=cfg["preprocess"])
+    feature_cols = screening.get_top_features(ranking, top_k=cfg["screening"]["top_k"])
+    df = preprocess.load_preprocessd(
+        cfg=cfg["preprocess"],
+        columns=models.get_training_columns(feature_cols, tickers=tickers),
+    )
+    model = train_model(df=df.iloc[rows], tickers=tickers, feature_cols=feature_cols)
+    evaluate_model(model)
+    save_model(model, cfg=cfg["model"])
+    logger.info("Main process completed")
+
+
+def train_model(
+    df: pd.DataFrame, tickers: List[str], feature_cols: List[str]
+) -> models.TickerModel:
+    """feature_cols are the screened features to train on"""
     logger.info("Training model...")
-    return "model"
+    logger.info(f"Using {len(feature_cols)} screened features")
+    return models.train_ticker_model(df=df, tickers=tickers, feature_cols=feature_cols)
 
 
 def evaluate_model(model):
@@ -39,9 +93,9 @@ def evaluate_model(model):
     logger.info(model)
 
 
-def save_model(model):
+def save_model(model: models.TickerModel, cfg: Dict[str, Any]) -> None:
     logger.info("Saving model...")
-    logger.info(model)
+    models.save_model(model=model, cfg=cfg)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+from logging import getLogger, basicConfig, INFO
+import os
+import pickle
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+MODEL_FILE = "model.pkl"
+
+
+class TickerModel:
+    """one model for all tickers: a row per ticker and day, with that ticker's features in
+    the same order for every ticker, scored for the chance label_{ticker} is 1 (the ticker
+    beats the index the next day).
+    """
+
+    def __init__(self, estimator: Any, suffixes: List[str]):
+        self.estimator = estimator
+        self.suffixes = suffixes
+
+    def get_columns(self, ticker: str) -> List[str]:
+        return [f"{ticker}_{suffix}" for suffix in self.suffixes]
+
+    def get_features(self, df: pd.DataFrame, tickers: List[str], iloc: int) -> np.ndarray:
+        """tickers x features for the day iloc"""
+        row = df.iloc[iloc]
+        return np.array(
+            [
+                row[self.get_columns(ticker)].to_numpy(dtype=np.float64)
+                for ticker in tickers
+            ]
+        )
+
+    def score(self, x: np.ndarray) -> np.ndarray:
+        x = np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0)
+        if hasattr(self.estimator, "predict_proba"):
+            return self.estimator.predict_proba(x)[:, 1]
+        return np.asarray(self.estimator.predict(x), dtype=np.float64)
+
+
+def get_feature_suffixes(feature_cols: List[str], tickers: List[str]) -> List[str]:
+    """the {feat}_{anchor}d_{lag}d part of {ticker}_{feat}_{anchor}d_{lag}d columns, in
+    order of first appearance
+    """
+    suffixes: List[str] = []
+    for col in feature_cols:
+        for ticker in tickers:
+            prefix = f"{ticker}_"
+            suffix = col.removeprefix(prefix)
+            if col.startswith(prefix) and suffix not in suffixes:
+                suffixes.append(suffix)
+    return suffixes
+
+
+def get_training_columns(feature_cols: List[str], tickers: List[str]) -> List[str]:
+    """columns train_ticker_model reads, to load only those from the preprocessed data"""
+    suffixes = get_feature_suffixes(feature_cols, tickers=tickers)
+    cols = [f"{ticker}_{suffix}" for ticker in tickers for suffix in suffixes]
+    cols += [f"label_{ticker}" for ticker in tickers]
+    cols += [f"label_{ticker}_pdiff_1f" for ticker in tickers]
+    return cols
+
+
+def train_ticker_model(
+    df: pd.DataFrame, tickers: List[str], feature_cols: List[str]
+) -> TickerModel:
+    """fits a logistic regression on the days where all features and the label are known.
+
+    Args:
+        df (pd.DataFrame): preprocessed data
+        tickers (List[str]): tickers to stack
+        feature_cols (List[str]): i.e, top screened features, each feature of any ticker is
+            used for all tickers
+
+    Returns:
+        TickerModel: the fitted model
+    """
+    suffixes = get_feature_suffixes(feature_cols, tickers=tickers)
+    model = TickerModel(
+        estimator=make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000)),
+        suffixes=suffixes,
+    )
+    xs, ys = [], []
+    for ticker in tickers:
+        x = df[model.get_columns(ticker)].to_numpy(dtype=np.float64)
+        has_label = df[f"label_{ticker}_pdiff_1f"].notna().to_numpy()
+        valid = np.isfinite(x).all(axis=1) & has_label
+        xs.append(x[valid])
+        ys.append(df[f"label_{ticker}"].to_numpy()[valid])
+    x, y = np.concatenate(xs), np.concatenate(ys)
+    logger.info(f"Fitting model on {len(x)} rows x {len(suffixes)} features")
+    model.estimator.fit(x, y)
+    return model
+
+
+def save_model(model: TickerModel, cfg: Dict[str, Any]) -> str:
+    os.makedirs(cfg["model_dir"], exist_ok=True)
+    output = os.path.join(cfg["model_dir"], MODEL_FILE)
+    logger.info(f"Saving model to {output}")
+    with open(output + ".tmp", "wb") as fh:
+        pickle.dump(model, fh)
+    # replace in one step so a server reloading the model never sees a partial file
+    os.replace(output + ".tmp", output)
+    return output
+
+
+def load_model(cfg: Dict[str, Any]) -> TickerModel:
+    fname = os.path.join(cfg["model_dir"], MODEL_FILE)
+    if not os.path.exists(fname):
+        raise FileNotFoundError(f"No model found in {cfg['model_dir']}")
+    logger.info(f"Loading model from {fname}")
+    with open(fname, "rb") as fh:
+        return pickle.load(fh)
@@ -1,10 +1,28 @@
 import numpy as np
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import pandas as pd
+import daytradeai.kernels as kernels
 import daytradeai.preprocess as preprocess
 
 
+def get_day_runs(start_iloc: int, end_iloc: int, num_days: int) -> List[Tuple[int, int]]:
+    """the rows range(start_iloc, end_iloc + 1) visits, as the evaluate loop does, in
+    inclusive runs of non negative consecutive rows. Empty for an empty range, two runs
+    when the range goes from negative ilocs to non negative ones. IndexError like df.iloc
+    if the range visits a row out of range.
+    """
+    if start_iloc > end_iloc:
+        return []
+    if start_iloc < -num_days or end_iloc >= num_days:
+        raise IndexError(
+            f"ilocs {start_iloc} to {end_iloc} out of range for {num_days} days"
+        )
+    if start_iloc < 0 <= end_iloc:
+        return [(start_iloc % num_days, num_days - 1), (0, end_iloc)]
+    return [(start_iloc % num_days, end_iloc % num_days)]
+
+
 class Policy:
     def __init__(self):
         pass
@@ -12,6 +30,22 @@ class Policy:
     def get_stock(self, iloc: int) -> str:
         raise NotImplementedError
 
+    def get_params(self) -> Optional[Dict[str, Any]]:
+        """what, besides the class and the data, determines the picks. None if the picks
+        are not reproducible, then evaluation results are not cached.
+        """
+        return None
+
+    def reset(self) -> None:
+        """back to the state right after construction, before a cached evaluation"""
+        pass
+
+    def get_data_columns(self) -> Optional[List[str]]:
+        """columns of the data the picks depend on, for the cache fingerprint. None if
+        unknown, then all columns are hashed.
+        """
+        return None
+
 
 class ControlPolicy(Policy):
     def __init__(self, index_name: str):
@@ -21,14 +55,36 @@ class ControlPolicy(Policy):
     def get_stock(self, iloc: int) -> str:
         return self.index_name
 
+    def get_params(self) -> Optional[Dict[str, Any]]:
+        return dict(index_name=self.index_name)
+
+    def get_data_columns(self) -> Optional[List[str]]:
+        return []
+
 
 class RandomPolicy(Policy):
-    def __init__(self, stocks: List[str]):
+    def __init__(self, stocks: List[str], seed: Optional[int] = None):
+        """without a seed, picks come from the global np.random state"""
         super().__init__()
         self.stocks = stocks
+        self.seed = seed
+        self.reset()
+
+    def reset(self) -> None:
+        self.rng = None if self.seed is None else np.random.default_rng(self.seed)
 
     def get_stock(self, iloc: int) -> str:
-        return np.random.choice(self.stocks)
+        if self.rng is None:
+            return np.random.choice(self.stocks)
+        return self.stocks[self.rng.integers(len(self.stocks))]
+
+    def get_params(self) -> Optional[Dict[str, Any]]:
+        if self.seed is None:
+            return None
+        return dict(stocks=list(self.stocks), seed=self.seed)
+
+    def get_data_columns(self) -> Optional[List[str]]:
+        return []
 
 
 class MaxFeatPolicy(Policy):
@@ -43,11 +99,146 @@ class MaxFeatPolicy(Policy):
         self.lag = lag
 
     def get_stock(self, iloc: int) -> str:
-        feat_cols = [
+        feat_cols = self.get_data_columns()
+        stock_idx = np.argmax(self.df[[col for col in feat_cols]].iloc[iloc])
+        return self.stocks[stock_idx]
+
+    def get_data_columns(self) -> List[str]:
+        return [
             preprocess.get_feat_name(
                 col=stock, feat=self.feat, anchor=self.anchor, lag=self.lag
             )
             for stock in self.stocks
         ]
-        stock_idx = np.argmax(self.df[[col for col in feat_cols]].iloc[iloc])
-        return self.stocks[stock_idx]
+
+    def get_params(self) -> Optional[Dict[str, Any]]:
+        return dict(
+            stocks=list(self.stocks), feat=self.feat, anchor=self.anchor, lag=self.lag
+        )
+
+
+class StatefulPolicy(Policy):
+    """Policy whose pick depends on its own history (what it holds, for how long, how that
+    went), ranking stocks by a feature like MaxFeatPolicy. Subclasses set step, a function
+    from kernels. get_stock is the day by day reference for evaluate, run does the same in
+    one compiled loop (numba, if installed) and run_grid sweeps parameters.
+    """
+
+    step: Callable = staticmethod(kernels.hold_step)
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        stocks: List[str],
+        feat: str,
+        anchor: int,
+        lag: int,
+        params: List[float],
+    ):
+        super().__init__()
+        self.stocks = stocks
+        self.feat = feat
+        self.anchor = anchor
+        self.lag = lag
+        self.params = np.asarray(params, dtype=np.float64)
+        self.scores = df[self.get_data_columns()].to_numpy(dtype=np.float64)
+        self.returns = df[[f"label_{stock}_pdiff_1f" for stock in stocks]].to_numpy(
+            dtype=np.float64
+        )
+        self.reset()
+
+    def reset(self) -> None:
+        self.state = kernels.init_state()
+        self.last_iloc = None
+
+    def get_params(self) -> Optional[Dict[str, Any]]:
+        return dict(
+            stocks=list(self.stocks),
+            feat=self.feat,
+            anchor=self.anchor,
+            lag=self.lag,
+            params=self.params.tolist(),
+        )
+
+    def get_data_columns(self) -> List[str]:
+        return [
+            preprocess.get_feat_name(
+                col=stock, feat=self.feat, anchor=self.anchor, lag=self.lag
+            )
+            for stock in self.stocks
+        ]
+
+    def get_stock(self, iloc: int) -> str:
+        """assumes consecutive ilocs, as in evaluate, call reset between runs"""
+        if self.last_iloc is not None:
+            holding = int(self.state[kernels.HOLDING_IDX])
+            ratio = 1.0 + self.returns[self.last_iloc, holding] / 100.0
+            kernels.apply_return(self.state, ratio)
+        pick = type(self).step(self.state, self.scores[iloc], self.params)
+        kernels.enter_position(self.state, pick)
+        self.last_iloc = iloc
+        return self.stocks[pick]
+
+    def get_day_range(self, start_iloc: int, end_iloc: int) -> Tuple[int, int]:
+        """first and last row the evaluate loop visits, (0, -1) if it visits none. Ranges
+        from a negative to a non negative iloc wrap around the end of the data, which the
+        compiled loop does not do, so they are rejected.
+        """
+        runs = get_day_runs(start_iloc, end_iloc, num_days=len(self.scores))
+        if len(runs) == 0:
+            return 0, -1
+        if len(runs) > 1:
+            raise ValueError(
+                f"ilocs {start_iloc} to {end_iloc} wrap around the end of the data, use "
+                "ilocs with the same sign"
+            )
+        return runs[0]
+
+    def run(
+        self, start_iloc: int, end_iloc: int, v0: float = 1.0
+    ) -> Tuple[List[float], List[str]]:
+        """same result as evaluate.get_asset_values_and_stocks with this policy"""
+        start, end = self.get_day_range(start_iloc=start_iloc, end_iloc=end_iloc)
+        vals, picks = kernels.compiled_run_policy(
+            kernels.get_compiled_step(type(self).step),
+            self.scores,
+            self.returns,
+            self.params,
+            start,
+            end,
+            v0,
+        )
+        return list(vals), [self.stocks[pick] for pick in picks]
+
+    def run_grid(
+        self, start_iloc: int, end_iloc: int, param_grid: np.ndarray, v0: float = 1.0
+    ) -> np.ndarray:
+        """final value for each row of param_grid (combinations x params)"""
+        start, end = self.get_day_range(start_iloc=start_iloc, end_iloc=end_iloc)
+        return kernels.compiled_run_policy_grid(
+            kernels.get_compiled_step(type(self).step),
+            self.scores,
+            self.returns,
+            np.atleast_2d(np.asarray(param_grid, dtype=np.float64)),
+            start,
+            end,
+            v0,
+        )
+
+
+class HoldPolicy(StatefulPolicy):
+    """params: [min days to hold a pick]"""
+
+    step = staticmethod(kernels.hold_step)
+
+
+class StopLossPolicy(StatefulPolicy):
+    """params: [percent loss since buying that triggers a switch]"""
+
+    step = staticmethod(kernels.stop_loss_step)
+
+
+class SwitchMarginPolicy(StatefulPolicy):
+    """params: [score margin the best stock needs over the current one to switch]"""
+
+    step = staticmethod(kernels.switch_margin_step)
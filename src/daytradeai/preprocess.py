@@ -1,8 +1,13 @@
 from logging import getLogger, basicConfig, INFO
 import os
 import glob
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+import daytradeai.data as data
+import daytradeai.indices as indices
+import daytradeai.snapshots as snapshots
 from daytradeai.stocks import get_tickers
 
 
@@ -13,6 +18,12 @@ basicConfig(
 )  # remove seconds and milliseconds
 logger = getLogger(__name__)
 
+# trailing window statistics of the price, the window length is the lag
+ROLLING_FEATS = ["rmean", "rstd", "rzscore", "rmin", "rmax", "rdrawdown"]
+
+# peak memory of preprocessing a group, relative to the size of its output frame
+MEMORY_OVERHEAD = 3
+
 
 def preprocess_data(
     df: pd.DataFrame, data_cfg: Dict[str, Any], preprocess_cfg: Dict[str, Any]
@@ -25,14 +36,133 @@ def preprocess_data(
     df = add_cash_fund(df)
     tickers_plus_cash = tickers + ["cash"]
 
+    index_performance = None
+    if preprocess_cfg.get("index_weighting", "equal") != "equal":
+        index_performance = indices.get_index_performance(
+            df,
+            stocks=tickers_plus_cash,
+            weighting=preprocess_cfg["index_weighting"],
+            group=data_cfg["stocks"],
+            halflife=preprocess_cfg.get("index_halflife", 60),
+        )
+    df = add_lag_feats(df=df, tickers=tickers_plus_cash, preprocess_cfg=preprocess_cfg)
+    df = label_beat_index_1d(df, tickers_plus_cash, preprocess_cfg, index_performance)
+    return df
+
+
+def preprocess_data_out_of_core(
+    data_cfg: Dict[str, Any], preprocess_cfg: Dict[str, Any]
+) -> str:
+    """same features and labels as preprocess_data, but reads the downloaded prices a group of
+    tickers at a time and writes each group's columns to its own part file as it goes. Group
+    sizes are chosen so a group stays within preprocess_cfg["memory_budget_mb"]. The
+    index performance the labels need is reduced over all groups in a first pass that only
+    reads prices.
+
+    Args:
+        data_cfg (Dict[str, Any]): data configuration, where the downloads are
+        preprocess_cfg (Dict[str, Any]): preprocess configuration
+
+    Returns:
+        str: directory with the part files, load with load_preprocessd
+    """
+    logger.info("Preprocessing data out of core...")
+    if "pdiff" not in preprocess_cfg["lag_feats"]:
+        raise ValueError("Label requires pdiff")
+
+    index = data.get_downloaded_index(cfg=data_cfg)
+    if len(index) == 0:
+        raise FileNotFoundError("No downloaded data to preprocess")
+    tickers_plus_cash = get_tickers(group=data_cfg["stocks"]) + ["cash"]
+    groups = get_ticker_groups(
+        tickers=tickers_plus_cash, num_rows=len(index), preprocess_cfg=preprocess_cfg
+    )
+
+    if preprocess_cfg.get("index_weighting", "equal") == "cap":
+        indices.check_cap_weights(tickers_plus_cash, group=data_cfg["stocks"])
+    # every index weighting weights each stock independently of the others, so the
+    # weighted sums of the groups add up
+    index_sum = pd.Series(0.0, index=index)
+    index_weight = pd.Series(0.0, index=index)
+    for group in groups:
+        prices = get_group_prices(data_cfg, preprocess_cfg, group=group, index=index)
+        sums = indices.get_weighted_pdiff_1f(
+            prices,
+            stocks=list(prices.columns),
+            weighting=preprocess_cfg.get("index_weighting", "equal"),
+            group=data_cfg["stocks"],
+            halflife=preprocess_cfg.get("index_halflife", 60),
+        )
+        index_sum += sums["weighted_sum"]
+        index_weight += sums["weight"]
+    index_performance = index_sum / index_weight.where(index_weight > 0)
+
+    output_dir = os.path.join(
+        preprocess_cfg["data_dir"], index.max().strftime("%Y-%m-%d")
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    for fname in get_preprocessed_parts(output_dir):
+        os.remove(fname)
+    for group_idx, group in enumerate(groups):
+        df = get_group_prices(data_cfg, preprocess_cfg, group=group, index=index)
+        group = list(df.columns)
+        df = add_lag_feats(df=df, tickers=group, preprocess_cfg=preprocess_cfg)
+        df = label_beat_index_1d(df, group, preprocess_cfg, index_performance)
+        output = os.path.join(output_dir, f"part-{group_idx:05d}.parquet")
+        logger.info(f"Saving preprocessed data for {len(group)} tickers to {output}")
+        df.to_parquet(output)
+    return output_dir
+
+
+def get_ticker_groups(
+    tickers: List[str], num_rows: int, preprocess_cfg: Dict[str, Any]
+) -> List[List[str]]:
+    """splits tickers into groups whose preprocessed frames fit in the memory budget"""
+    anchor_and_lags = preprocess_cfg["anchor_and_lags"]
+    num_lags = sum(len(lags) for lags in anchor_and_lags.values())
+    # price, label pdiff and label columns, plus the features
+    cols_per_ticker = 3 + len(preprocess_cfg["lag_feats"]) * num_lags
+    ticker_bytes = num_rows * cols_per_ticker * 8 * MEMORY_OVERHEAD
+    budget_bytes = preprocess_cfg["memory_budget_mb"] * 2**20
+    group_size = max(1, int(budget_bytes // ticker_bytes))
+    logger.info(f"Preprocessing {len(tickers)} tickers in groups of {group_size}")
+    starts = range(0, len(tickers), group_size)
+    return [tickers[start:][:group_size] for start in starts]
+
+
+def get_group_prices(
+    data_cfg: Dict[str, Any],
+    preprocess_cfg: Dict[str, Any],
+    group: List[str],
+    index: pd.DatetimeIndex,
+) -> pd.DataFrame:
+    """prices for the tickers in group, aligned to index. Tickers that were not downloaded
+    are left out.
+    """
+    stocks = [ticker for ticker in group if ticker != "cash"]
+    df = pd.DataFrame(index=index)
+    if stocks:
+        df = data.get_downloaded_prices(
+            cfg=data_cfg, price=preprocess_cfg["price"], tickers=stocks
+        ).reindex(index)
+    missing = [ticker for ticker in stocks if ticker not in df.columns]
+    if missing:
+        logger.warning(f"No downloaded prices for {missing}, skipping them")
+    if "cash" in group:
+        df = add_cash_fund(df)
+    return df
+
+
+def add_lag_feats(
+    df: pd.DataFrame, tickers: List[str], preprocess_cfg: Dict[str, Any]
+) -> pd.DataFrame:
     for lag_feat in preprocess_cfg["lag_feats"]:
         df = add_lag_feat(
             df=df,
-            tickers=tickers_plus_cash,
+            tickers=tickers,
             feat=lag_feat,
             anchor_and_lags=preprocess_cfg["anchor_and_lags"],
         )
-    df = label_beat_index_1d(df, tickers_plus_cash, preprocess_cfg)
     return df
 
 
@@ -49,6 +179,10 @@ def get_feat_name(col, feat, anchor, lag):
 def add_lag_feat(
     df: pd.DataFrame, tickers: List[str], feat: str, anchor_and_lags: Dict[int, List[int]]
 ) -> pd.DataFrame:
+    if feat in ROLLING_FEATS:
+        return add_rolling_feat(
+            df=df, tickers=tickers, feat=feat, anchor_and_lags=anchor_and_lags
+        )
     logger.info(f"Adding {feat} lag features")
     for anchor, lags in anchor_and_lags.items():
         for lag in lags:
@@ -65,12 +199,133 @@ def add_lag_feat(
     return df
 
 
+def add_rolling_feat(
+    df: pd.DataFrame, tickers: List[str], feat: str, anchor_and_lags: Dict[int, List[int]]
+) -> pd.DataFrame:
+    """adds rolling window features for all tickers at once. The lag is the window length,
+    the window ends at the anchor day. Computed on the 2-D price matrix with cumulative sums
+    and block prefix/suffix extrema, so the cost does not depend on the window length.
+
+    Args:
+        df (pd.DataFrame): prices, one column per ticker
+        tickers (List[str]): columns to compute features for
+        feat (str): one of ROLLING_FEATS
+        anchor_and_lags (Dict[int, List[int]]): anchor days and window lengths
+
+    Returns:
+        pd.DataFrame: df with the new columns, named as in get_feat_name
+    """
+    logger.info(f"Adding {feat} rolling features")
+    if feat not in ROLLING_FEATS:
+        raise ValueError(
+            f"Unknown rolling feature {feat}, must be one of {ROLLING_FEATS}"
+        )
+    prices = df[tickers].to_numpy(dtype=np.float64)
+    new_cols = dict()
+    for anchor, lags in anchor_and_lags.items():
+        cur = shift_rows(prices, anchor)
+        for lag in lags:
+            vals = get_rolling_feat(cur, feat=feat, window=lag)
+            for idx, col in enumerate(tickers):
+                feature_name = get_feat_name(col=col, feat=feat, anchor=anchor, lag=lag)
+                new_cols[feature_name] = vals[:, idx]
+    df = df.drop(columns=[col for col in new_cols if col in df.columns])
+    return pd.concat([df, pd.DataFrame(new_cols, index=df.index)], axis=1)
+
+
+def shift_rows(x: np.ndarray, n: int) -> np.ndarray:
+    """same as DataFrame.shift(n) for n >= 0 on a 2-D array"""
+    if n == 0:
+        return x
+    out = np.full_like(x, np.nan)
+    if n < len(x):
+        out[n:] = x[:-n]
+    return out
+
+
+def get_rolling_feat(x: np.ndarray, feat: str, window: int) -> np.ndarray:
+    """rolling feature over the trailing window along axis 0. Like pandas rolling with
+    min_periods=window, the result is NaN unless all values in the window are present.
+    """
+    if feat in ("rmin", "rmax", "rdrawdown"):
+        fn = np.minimum if feat == "rmin" else np.maximum
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vals = rolling_extreme(x, window=window, fn=fn)
+            if feat == "rdrawdown":
+                vals = 100.0 * (x - vals) / vals
+    else:
+        mean, std = rolling_mean_std(x, window=window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vals = dict(rmean=mean, rstd=std, rzscore=(x - mean) / std)[feat]
+    incomplete = rolling_sum(np.isnan(x).astype(np.float64), window=window) != 0
+    vals[incomplete | np.isnan(vals)] = np.nan
+    return vals
+
+
+def rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """trailing window sum along axis 0, x must be finite. The first window - 1 rows are NaN.
+    Uses the same block scheme as rolling_extreme rather than one cumulative sum over the
+    whole history, so the rounding error grows with the window and not the series length.
+    """
+    return rolling_extreme(x, window=window, fn=np.add)
+
+
+def rolling_mean_std(x: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """trailing window mean and sample standard deviation (ddof=1, as pandas) along axis 0.
+    Columns are centered first to limit cancellation in the sum of squares.
+    """
+    finite = np.isfinite(x)
+    center = np.where(finite, x, 0.0).sum(axis=0) / np.maximum(finite.sum(axis=0), 1)
+    xc = np.where(finite, x - center, 0.0)
+    s1 = rolling_sum(xc, window=window)
+    s2 = rolling_sum(xc * xc, window=window)
+    mean = center + s1 / window
+    if window < 2:
+        return mean, np.full(x.shape, np.nan)
+    var = np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0)
+    return mean, np.sqrt(var)
+
+
+def rolling_extreme(x: np.ndarray, window: int, fn: np.ufunc = np.minimum) -> np.ndarray:
+    """trailing window min (fn=np.minimum), max (fn=np.maximum) or sum (fn=np.add) along
+    axis 0.
+
+    van Herk/Gil-Werman: split rows into blocks of length window and accumulate fn forward
+    and backward within each block. A window ending at row i is covered by the backward run
+    from row i - window + 1 and the forward run up to row i, so each output is one more fn
+    call - O(n) for any window length. NaNs propagate into the windows that contain them.
+    """
+    num_rows, num_cols = x.shape
+    out = np.full(x.shape, np.nan)
+    if window < 1 or window > num_rows:
+        return out
+    num_blocks = -(-num_rows // window)
+    fill = {np.minimum: np.inf, np.maximum: -np.inf, np.add: 0.0}[fn]
+    pad = np.full((num_blocks * window - num_rows, num_cols), fill)
+    blocks = np.concatenate([x, pad]).reshape(num_blocks, window, num_cols)
+    forward = fn.accumulate(blocks, axis=1).reshape(-1, num_cols)
+    backward = fn.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, num_cols)
+    first, last = window - 1, num_rows - window + 1
+    out[first:] = fn(backward[:last], forward[first:num_rows])
+    # windows that are exactly one block, fn may not be idempotent (np.add)
+    out[first::window] = forward[first:num_rows:window]
+    return out
+
+
 def label_beat_index_1d(
-    df: pd.DataFrame, stocks: List[str], preprocess_cfg: Dict[str, Any]
+    df: pd.DataFrame,
+    stocks: List[str],
+    preprocess_cfg: Dict[str, Any],
+    index_performance: Optional[pd.Series] = None,
 ) -> pd.DataFrame:
     """
     add column label_{ticker} that is 1 if the stock outperforms the index by pdiff. The index is a equally weighted
     investimement in stocks. The labels should be 50/50 for success/failure, overall.
+
+    For other index weightings (see indices.py) pass their index_performance.
+
+    index_performance is the next day pdiff of the index, pass it when df only holds some of
+    the stocks in the index.
     """
     logger.info("Adding label")
     if "pdiff" not in preprocess_cfg["lag_feats"]:
@@ -84,7 +339,10 @@ def label_beat_index_1d(
         ].shift(-1)
     # assume index is equally weighted -
     # note this is note how DIJA or S&P500 is calculated (DIJA is price weighted, with divisor, S&P500 is market cap weighted)
-    index_performance = df[[f"label_{stock}_pdiff_1f" for stock in stocks]].mean(axis=1)
+    if index_performance is None:
+        index_performance = df[[f"label_{stock}_pdiff_1f" for stock in stocks]].mean(
+            axis=1
+        )
 
     # create labels for each stock, 0/1 for
     for stock in stocks:
@@ -96,6 +354,9 @@ def label_beat_index_1d(
 
 
 def save_preprocessed(df: pd.DataFrame, cfg: Dict[str, Any]) -> None:
+    if cfg.get("snapshots"):
+        snapshots.commit_snapshot(df=df, cfg=cfg)
+        return
     latest_day = df.index.max().strftime("%Y-%m-%d")
     os.makedirs(cfg["data_dir"], exist_ok=True)
     output = os.path.join(cfg["data_dir"], latest_day + ".parquet")
@@ -106,13 +367,71 @@ def save_preprocessed(df: pd.DataFrame, cfg: Dict[str, Any]) -> None:
     df.to_parquet(output)
 
 
-def load_preprocessd(cfg: Dict[str, Any]) -> pd.DataFrame:
-    files = sorted(glob.glob(os.path.join(cfg["data_dir"], "*.parquet")), reverse=True)
-    if len(files) == 0:
+def get_latest_preprocessed_path(cfg: Dict[str, Any]) -> str:
+    """file or part directory load_preprocessd reads for the latest data, its mtime changes
+    whenever new preprocessed data is saved. The newest by latest day across the snapshot
+    store, single files from preprocess_data and part directories from
+    preprocess_data_out_of_core; on the same day the one written last. The snapshot store
+    is its manifest, latest.parquet is missing after a crash in the first commit.
+    """
+    candidates = [
+        (os.path.basename(fname).split(".")[0], os.path.getmtime(fname), fname)
+        for fname in glob.glob(os.path.join(cfg["data_dir"], "*.parquet"))
+    ]
+    part_dirs = {
+        os.path.dirname(part)
+        for part in glob.glob(os.path.join(cfg["data_dir"], "*", "part-*.parquet"))
+    }
+    candidates += [
+        (os.path.basename(part_dir), os.path.getmtime(part_dir), part_dir)
+        for part_dir in part_dirs
+    ]
+    if snapshots.has_snapshots(cfg):
+        manifest = snapshots.get_manifest_path(cfg)
+        candidates.append(
+            (snapshots.list_versions(cfg)[-1], os.path.getmtime(manifest), manifest)
+        )
+    if len(candidates) == 0:
         raise FileNotFoundError(f"No preprocessed data found in {cfg['data_dir']}")
-    latest_file = files[0]
+    return max(candidates)[2]
+
+
+def load_preprocessd(
+    cfg: Dict[str, Any],
+    version: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """loads the latest preprocessed data, see get_latest_preprocessed_path: from the
+    snapshot store, a single file from preprocess_data or a directory of part files from
+    preprocess_data_out_of_core. version loads an older version from the snapshot store, see
+    snapshots.list_versions. columns only reads those columns, i.e, the top features from
+    screening plus labels.
+    """
+    if version is not None:
+        if not snapshots.has_snapshots(cfg):
+            raise FileNotFoundError(f"No preprocessed snapshots in {cfg['data_dir']}")
+        return snapshots.load_snapshot(cfg=cfg, version=version, columns=columns)
+    latest_file = get_latest_preprocessed_path(cfg)
+    if latest_file == snapshots.get_manifest_path(cfg):
+        return snapshots.load_snapshot(cfg=cfg, columns=columns)
     logger.info(f"Loading preprocessed data from {latest_file}")
-    return pd.read_parquet(latest_file)
+    if os.path.isdir(latest_file):
+        parts = get_preprocessed_parts(latest_file)
+        dfs = []
+        for part in parts:
+            part_columns = None
+            if columns is not None:
+                available = set(pq.read_schema(part).names)
+                part_columns = [col for col in columns if col in available]
+            dfs.append(pd.read_parquet(part, columns=part_columns))
+        df = pd.concat(dfs, axis=1)
+        return df if columns is None else df[columns]
+    return pd.read_parquet(latest_file, columns=columns)
+
+
+def get_preprocessed_parts(output_dir: str) -> List[str]:
+    """part files written by preprocess_data_out_of_core"""
+    return sorted(glob.glob(os.path.join(output_dir, "part-*.parquet")))
 
 
 def get_feature_columns(df: pd.DataFrame, suffix: str, tickers: List[str]) -> List[str]:
@@ -0,0 +1,201 @@
+"""Feature screening between preprocessing and training.
+
+Every feature column {ticker}_{feat}_{anchor}d_{lag}d is scored against that ticker's
+label_{ticker}, for all columns at once in chunks of columns with masked matrix sums:
+
+    mi              mutual information (nats) of the quantile binned feature and the label
+    pb_corr         point-biserial correlation, Pearson correlation with the 0/1 label
+    fold_corr_mean  mean and std of pb_corr over contiguous time folds
+    fold_corr_std
+    sign_stability  fraction of folds where pb_corr has the same sign as overall
+
+Rows where the feature is NaN, or the label is undefined (last day), are left out per
+column. Only the rows from get_screening_rows are screened, the last holdout_days that
+visualize and evaluate backtest on are held out, so picking features does not look at
+their labels.
+"""
+
+import os
+from logging import getLogger, basicConfig, INFO
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import daytradeai.splits as splits
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+RANKING_FILE = "feature_ranking.csv"
+
+
+def get_ticker_feature_columns(df: pd.DataFrame, tickers: List[str]) -> Dict[str, str]:
+    """feature column -> ticker, for every column named {ticker}_..."""
+    col2ticker = dict()
+    for ticker in tickers:
+        prefix = f"{ticker}_"
+        for col in df.columns:
+            if col.startswith(prefix):
+                col2ticker[col] = ticker
+    return col2ticker
+
+
+def get_screening_rows(num_rows: int, screening_cfg: Dict[str, Any]) -> slice:
+    """rows before the last holdout_days, less the label horizon before them"""
+    folds = splits.get_walk_forward_folds(
+        num_rows=num_rows, num_folds=1, test_size=screening_cfg["holdout_days"]
+    )
+    if not folds:
+        raise ValueError(
+            f"No rows to screen: {num_rows} rows, holdout_days="
+            f"{screening_cfg['holdout_days']}"
+        )
+    return folds[0].train[0]
+
+
+def masked_corr(x: np.ndarray, y: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """column wise Pearson correlation of x and y over the rows where valid, 0 where either
+    is constant
+    """
+    num = valid.sum(axis=0)
+    safe_num = np.maximum(num, 1)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    # center so the sums of squares do not cancel for features like price levels
+    x = np.where(valid, x - x.sum(axis=0) / safe_num, 0.0)
+    y = np.where(valid, y - y.sum(axis=0) / safe_num, 0.0)
+    cov = (x * y).sum(axis=0)
+    var = (x * x).sum(axis=0) * (y * y).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cov / np.sqrt(var)
+    return np.where((var > 0) & (num > 1), corr, 0.0)
+
+
+def masked_mutual_info(
+    x: np.ndarray, y: np.ndarray, valid: np.ndarray, num_bins: int
+) -> np.ndarray:
+    """column wise mutual information between x, cut into num_bins quantile bins, and the
+    0/1 label y, over the rows where valid
+    """
+    num_cols = x.shape[1]
+    quantiles = np.linspace(0, 1, num_bins + 1)[1:-1]
+    edges = np.zeros((len(quantiles), num_cols))
+    has_rows = valid.any(axis=0)
+    with np.errstate(invalid="ignore"):
+        x = np.where(valid, x, np.nan)
+        edges[:, has_rows] = np.nanquantile(x[:, has_rows], quantiles, axis=0)
+        codes = (x[:, :, None] > edges.T[None, :, :]).sum(axis=2)
+    joint = np.arange(num_cols)[None, :] * (2 * num_bins) + codes * 2 + y.astype(np.int64)
+    counts = np.bincount(joint[valid], minlength=num_cols * 2 * num_bins).astype(float)
+    p_joint = counts.reshape(num_cols, num_bins, 2)
+    p_joint /= np.maximum(p_joint.sum(axis=(1, 2), keepdims=True), 1.0)
+    p_bin = p_joint.sum(axis=2, keepdims=True)
+    p_label = p_joint.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        terms = p_joint * np.log(p_joint / (p_bin * p_label))
+    return np.nansum(terms, axis=(1, 2))
+
+
+def screen_features(
+    df: pd.DataFrame,
+    tickers: List[str],
+    screening_cfg: Dict[str, Any],
+    rows: Optional[slice] = None,
+) -> pd.DataFrame:
+    """scores every feature column of the tickers against its ticker's label.
+
+    Args:
+        df (pd.DataFrame): preprocessed data, with label_{ticker} and label_{ticker}_pdiff_1f
+        tickers (List[str]): tickers whose features to score
+        screening_cfg (Dict[str, Any]): num_bins, num_folds, chunk_size and sort_by
+        rows (Optional[slice], optional): only screen these rows, i.e, from
+            get_screening_rows. Defaults to None, all.
+
+    Returns:
+        pd.DataFrame: one row per feature, best first, see the module docstring
+    """
+    if rows is not None:
+        df = df.iloc[rows]
+    col2ticker = get_ticker_feature_columns(df, tickers=tickers)
+    feature_cols = list(col2ticker)
+    logger.info(f"Screening {len(feature_cols)} features of {len(tickers)} tickers")
+    labels = df[[f"label_{ticker}" for ticker in tickers]].to_numpy(dtype=np.float64)
+    label_valid = (
+        df[[f"label_{ticker}_pdiff_1f" for ticker in tickers]].notna().to_numpy()
+    )
+    ticker_idx = {ticker: idx for idx, ticker in enumerate(tickers)}
+    folds = np.array_split(np.arange(len(df)), screening_cfg["num_folds"])
+
+    chunk_size = screening_cfg["chunk_size"]
+    results = []
+    for start in range(0, len(feature_cols), chunk_size):
+        cols = feature_cols[start:][:chunk_size]
+        col_tickers = [ticker_idx[col2ticker[col]] for col in cols]
+        x = df[cols].to_numpy(dtype=np.float64)
+        y = labels[:, col_tickers]
+        valid = np.isfinite(x) & label_valid[:, col_tickers]
+        corr = masked_corr(x, y, valid)
+        fold_corr = np.stack(
+            [masked_corr(x[rows], y[rows], valid[rows]) for rows in folds]
+        )
+        results.append(
+            pd.DataFrame(
+                dict(
+                    feature=cols,
+                    ticker=[col2ticker[col] for col in cols],
+                    num_rows=valid.sum(axis=0),
+                    mi=masked_mutual_info(x, y, valid, screening_cfg["num_bins"]),
+                    pb_corr=corr,
+                    fold_corr_mean=fold_corr.mean(axis=0),
+                    fold_corr_std=fold_corr.std(axis=0),
+                    sign_stability=(np.sign(fold_corr) == np.sign(corr)).mean(axis=0),
+                )
+            )
+        )
+    return rank_features(pd.concat(results), sort_by=screening_cfg["sort_by"])
+
+
+def rank_features(ranking: pd.DataFrame, sort_by: str) -> pd.DataFrame:
+    """sorts best first by sort_by (abs value for correlations), sets the feature index"""
+    key = ranking[sort_by].abs() if "corr" in sort_by else ranking[sort_by]
+    ranking = ranking.assign(key=key).sort_values("key", ascending=False, kind="stable")
+    return ranking.drop(columns="key").set_index("feature")
+
+
+def screen_feature_parts(
+    parts: List[str],
+    tickers: List[str],
+    screening_cfg: Dict[str, Any],
+    rows: Optional[slice] = None,
+) -> pd.DataFrame:
+    """screen_features over the part files from preprocess_data_out_of_core, one at a time.
+    Each part has all the columns for its tickers, and the same rows.
+    """
+    rankings = []
+    for part in parts:
+        df = pd.read_parquet(part)
+        part_tickers = [ticker for ticker in tickers if f"label_{ticker}" in df.columns]
+        rankings.append(screen_features(df, part_tickers, screening_cfg, rows=rows))
+    ranking = pd.concat(rankings).reset_index()
+    return rank_features(ranking, sort_by=screening_cfg["sort_by"])
+
+
+def save_feature_ranking(ranking: pd.DataFrame, cfg: Dict[str, Any]) -> None:
+    os.makedirs(cfg["data_dir"], exist_ok=True)
+    output = os.path.join(cfg["data_dir"], RANKING_FILE)
+    logger.info(f"Saving feature ranking to {output}")
+    ranking.to_csv(output)
+
+
+def load_feature_ranking(cfg: Dict[str, Any]) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(cfg["data_dir"], RANKING_FILE), index_col="feature")
+
+
+def get_top_features(ranking: pd.DataFrame, top_k: int) -> List[str]:
+    return list(ranking.index[:top_k])
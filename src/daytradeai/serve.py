@@ -0,0 +1,363 @@
+"""Local prediction server for the trained model.
+
+Loads the model and the latest days of features once and serves, on localhost:
+
+    GET  /health
+    GET  /stats     latency percentiles, throughput, batch sizes, loaded versions
+    POST /score     {"tickers": [...], "date": "YYYY-MM-DD"} -> score of each ticker
+    POST /pick      same body -> the best scoring ticker
+
+tickers defaults to all of them and date to the latest day; GET /score and GET /pick use
+both defaults. Concurrent requests are queued and scored together, one model call per
+batch of up to max_batch rows, waiting at most max_wait_ms for a batch to fill. A new
+model file or new preprocessed data is picked up every reload_interval_s without a
+restart. Bad requests get a 400, a request not scored within request_timeout_s a 503 and
+a failing model a 500.
+
+Run with python -m daytradeai.serve
+"""
+
+from concurrent.futures import Future, TimeoutError
+from dataclasses import dataclass
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from logging import getLogger, basicConfig, INFO
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import daytradeai.config as config
+import daytradeai.models as models
+import daytradeai.preprocess as preprocess
+from daytradeai.stocks import get_tickers
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+
+@dataclass
+class ServingState:
+    """what a batch is scored with, replaced as a whole on reload"""
+
+    model: models.TickerModel
+    features: np.ndarray  # days x tickers x features
+    dates: List[str]
+    model_stamp: Tuple[str, float]
+    data_stamp: Tuple[str, float]
+
+
+@dataclass
+class ScoreRequest:
+    tickers: List[str]
+    date: Optional[str]
+    future: Future
+
+
+class ServerStats:
+    def __init__(self, max_latencies: int = 10000):
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.latencies_ms: deque = deque(maxlen=max_latencies)
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_batches = 0
+        self.num_batched_requests = 0
+        self.num_rows = 0
+
+    def record_request(self, latency_ms: float, error: bool) -> None:
+        with self.lock:
+            self.latencies_ms.append(latency_ms)
+            self.num_requests += 1
+            self.num_errors += int(error)
+
+    def record_batch(self, num_requests: int, num_rows: int) -> None:
+        with self.lock:
+            self.num_batches += 1
+            self.num_batched_requests += num_requests
+            self.num_rows += num_rows
+
+    def get(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = np.array(self.latencies_ms)
+            uptime_s = time.monotonic() - self.start_time
+            percentiles = dict()
+            if len(latencies):
+                for pct in [50, 90, 99]:
+                    percentiles[f"p{pct}"] = float(np.percentile(latencies, pct))
+            return dict(
+                uptime_s=uptime_s,
+                requests=self.num_requests,
+                errors=self.num_errors,
+                requests_per_s=self.num_requests / max(uptime_s, 1e-9),
+                batches=self.num_batches,
+                mean_batch_requests=self.num_batched_requests / max(self.num_batches, 1),
+                mean_batch_rows=self.num_rows / max(self.num_batches, 1),
+                latency_ms=percentiles,
+            )
+
+
+class BatchingHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with a listen backlog for bursts of clients, the stdlib default
+    of 5 resets connections the batcher could have served
+    """
+
+    def __init__(self, address: Tuple[str, int], handler: type, listen_backlog: int):
+        self.request_queue_size = listen_backlog  # read when the socket starts listening
+        super().__init__(address, handler)
+
+
+def get_stamp(path: str) -> Tuple[str, float]:
+    return path, os.path.getmtime(path)
+
+
+class PredictionServer:
+    def __init__(self, cfg: Dict[str, Any], tickers: Optional[List[str]] = None):
+        """
+        Args:
+            cfg (Dict[str, Any]): full config, uses data, preprocess, model and serve
+            tickers (Optional[List[str]], optional): Defaults to the stock group and cash.
+        """
+        self.cfg = cfg
+        self.serve_cfg = cfg["serve"]
+        self.tickers = tickers or get_tickers(group=cfg["data"]["stocks"]) + ["cash"]
+        self.ticker_idx = {ticker: idx for idx, ticker in enumerate(self.tickers)}
+        self.state = self.load_state()
+        self.stats = ServerStats()
+        self.requests: queue.Queue = queue.Queue()
+        self.running = threading.Event()
+        self.stopped = threading.Event()
+        self.httpd = BatchingHTTPServer(
+            (self.serve_cfg["host"], self.serve_cfg["port"]),
+            make_handler(self),
+            listen_backlog=self.serve_cfg["listen_backlog"],
+        )
+        self.threads: List[threading.Thread] = []
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        host, port = self.httpd.server_address[:2]
+        return str(host), int(port)
+
+    def get_stamps(self) -> Tuple[Tuple[str, float], Tuple[str, float]]:
+        model_file = os.path.join(self.cfg["model"]["model_dir"], models.MODEL_FILE)
+        data_path = preprocess.get_latest_preprocessed_path(self.cfg["preprocess"])
+        return get_stamp(model_file), get_stamp(data_path)
+
+    def load_state(self) -> ServingState:
+        model_stamp, data_stamp = self.get_stamps()
+        model = models.load_model(self.cfg["model"])
+        columns = [col for ticker in self.tickers for col in model.get_columns(ticker)]
+        df = preprocess.load_preprocessd(self.cfg["preprocess"], columns=columns)
+        df = df[columns].tail(self.serve_cfg["num_days"])
+        features = df.to_numpy(dtype=np.float64).reshape(
+            len(df), len(self.tickers), len(model.suffixes)
+        )
+        dates = [pd.Timestamp(day).strftime("%Y-%m-%d") for day in df.index]
+        logger.info(f"Serving {len(self.tickers)} tickers for {dates[0]} to {dates[-1]}")
+        return ServingState(
+            model=model,
+            features=features,
+            dates=dates,
+            model_stamp=model_stamp,
+            data_stamp=data_stamp,
+        )
+
+    def check_reload(self) -> bool:
+        """reloads if the model or the preprocessed data changed, True if it did"""
+        try:
+            stamps = self.get_stamps()
+            if stamps == (self.state.model_stamp, self.state.data_stamp):
+                return False
+            self.state = self.load_state()
+        except (FileNotFoundError, ValueError, KeyError) as err:
+            logger.warning(
+                f"Reload failed, keep serving the loaded model and data: {err}"
+            )
+            return False
+        logger.info("Reloaded model and data")
+        return True
+
+    def submit(self, tickers: Optional[List[str]], date: Optional[str]) -> Dict[str, Any]:
+        """queues a request for the batcher and waits for its scores"""
+        if tickers is not None and not isinstance(tickers, list):
+            raise ValueError(f"tickers must be a list, got {tickers!r}")
+        tickers = tickers or self.tickers
+        unknown = [ticker for ticker in tickers if ticker not in self.ticker_idx]
+        if unknown:
+            raise ValueError(f"Unknown tickers {unknown}")
+        request = ScoreRequest(tickers=tickers, date=date, future=Future())
+        self.requests.put(request)
+        return request.future.result(timeout=self.serve_cfg["request_timeout_s"])
+
+    def score_batch(self, batch: List[ScoreRequest]) -> None:
+        state = self.state
+        xs, results = [], []
+        for request in batch:
+            date = request.date or state.dates[-1]
+            if date not in state.dates:
+                request.future.set_exception(
+                    ValueError(f"No features for {date}, have {state.dates}")
+                )
+                continue
+            idxs = [self.ticker_idx[ticker] for ticker in request.tickers]
+            xs.append(state.features[state.dates.index(date), idxs])
+            results.append((request, date))
+        if not xs:
+            return
+        try:
+            scores = state.model.score(np.concatenate(xs))
+        except Exception as err:  # report to every waiting request, keep serving
+            for request, _ in results:
+                request.future.set_exception(err)
+            return
+        ends = np.cumsum([len(request.tickers) for request, _ in results])
+        for (request, date), request_scores in zip(results, np.split(scores, ends[:-1])):
+            request.future.set_result(
+                dict(
+                    date=date,
+                    scores=dict(zip(request.tickers, request_scores.tolist())),
+                )
+            )
+        self.stats.record_batch(num_requests=len(results), num_rows=len(scores))
+
+    def run_batcher(self) -> None:
+        max_wait_s = self.serve_cfg["max_wait_ms"] / 1000.0
+        while self.running.is_set():
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            num_rows = len(batch[0].tickers)
+            deadline = time.monotonic() + max_wait_s
+            while num_rows < self.serve_cfg["max_batch"]:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = (
+                        self.requests.get(timeout=remaining)
+                        if remaining > 0
+                        else self.requests.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                batch.append(request)
+                num_rows += len(request.tickers)
+            self.score_batch(batch)
+
+    def run_reloader(self) -> None:
+        while not self.stopped.wait(self.serve_cfg["reload_interval_s"]):
+            self.check_reload()
+
+    def start(self) -> None:
+        self.running.set()
+        self.stopped.clear()
+        for target in [self.httpd.serve_forever, self.run_batcher, self.run_reloader]:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        host, port = self.address
+        logger.info(f"Prediction server listening on http://{host}:{port}")
+
+    def stop(self) -> None:
+        if self.threads:  # shutdown waits for serve_forever, which only runs once started
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        self.running.clear()
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def __enter__(self) -> "PredictionServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def make_handler(server: PredictionServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format % args)
+
+        def send_json(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self.send_json(200, dict(status="ok"))
+            elif self.path == "/stats":
+                state = server.state
+                stats = server.stats.get()
+                stats.update(model=list(state.model_stamp), data=list(state.data_stamp))
+                self.send_json(200, stats)
+            else:
+                self.handle_predict(dict())
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as err:
+                self.send_json(400, dict(error=f"Invalid JSON: {err}"))
+                return
+            if not isinstance(body, dict):
+                self.send_json(400, dict(error="Body must be a JSON object"))
+                return
+            self.handle_predict(body)
+
+        def handle_predict(self, body: Dict[str, Any]) -> None:
+            if self.path not in ("/score", "/pick"):
+                self.send_json(404, dict(error=f"Unknown path {self.path}"))
+                return
+            start = time.monotonic()
+            try:
+                result = server.submit(tickers=body.get("tickers"), date=body.get("date"))
+            except ValueError as err:
+                self.send_error_json(start, 400, str(err))
+                return
+            except TimeoutError:
+                self.send_error_json(start, 503, "Timed out waiting for the batch")
+                return
+            except Exception as err:  # i.e, from the model, reported to every request
+                logger.exception("Scoring failed")
+                self.send_error_json(start, 500, f"Scoring failed: {err!r}")
+                return
+            if self.path == "/pick":
+                ticker = max(result["scores"], key=result["scores"].get)
+                result = dict(
+                    date=result["date"], ticker=ticker, score=result["scores"][ticker]
+                )
+            server.stats.record_request(1000 * (time.monotonic() - start), error=False)
+            self.send_json(200, result)
+
+        def send_error_json(self, start: float, status: int, error: str) -> None:
+            server.stats.record_request(1000 * (time.monotonic() - start), error=True)
+            self.send_json(status, dict(error=error))
+
+    return Handler
+
+
+if __name__ == "__main__":
+    with PredictionServer(cfg=config.cfg) as prediction_server:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            logger.info("Stopping prediction server")
@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from functools import partial
+from logging import getLogger, basicConfig, INFO
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+import sys
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import daytradeai.preprocess as preprocess
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SharedDatasetSpec:
+    """everything a worker needs to attach to a SharedDataset, small and cheap to pickle"""
+
+    name: str
+    shape: tuple
+    columns: List[str]
+    index: np.ndarray
+    index_name: Optional[str] = None
+
+
+class SharedDataset:
+    """preprocessed data held once in shared memory as a float64 block, column major so
+    every column is contiguous. The creating process owns the segment and unlinks it on
+    close, garbage collection or interpreter exit; if the owner is killed the
+    multiprocessing resource tracker unlinks it. Workers only ever attach, so a crashing
+    worker cannot leak or remove the segment.
+
+    Integer columns (the labels) come back as float64.
+    """
+
+    def __init__(self, spec: SharedDatasetSpec, shm: SharedMemory, owner: bool):
+        self.spec = spec
+        self.owner = owner
+        self._shm = shm
+        self._values: Optional[np.ndarray] = np.ndarray(
+            spec.shape, dtype=np.float64, buffer=shm.buf, order="F"
+        )
+        self._finalizer = weakref.finalize(self, release_shared_memory, shm, owner)
+
+    @classmethod
+    def create(cls, df: pd.DataFrame) -> "SharedDataset":
+        """copies the numeric columns of df into a new shared memory segment"""
+        df = df.select_dtypes(include="number")
+        shape = df.shape
+        shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order="F")
+        for idx, col in enumerate(df.columns):
+            values[:, idx] = df[col].to_numpy(dtype=np.float64)
+        del values
+        spec = SharedDatasetSpec(
+            name=shm.name,
+            shape=shape,
+            columns=list(df.columns),
+            index=df.index.to_numpy(),
+            index_name=df.index.name,
+        )
+        logger.info(
+            f"Created shared dataset {shm.name}, {shape[0]} rows x {shape[1]} cols"
+        )
+        return cls(spec=spec, shm=shm, owner=True)
+
+    @classmethod
+    def from_preprocessed(cls, cfg: Dict[str, Any]) -> "SharedDataset":
+        """loads the latest preprocessed snapshot and moves it to shared memory"""
+        return cls.create(preprocess.load_preprocessd(cfg))
+
+    @classmethod
+    def attach(cls, spec: SharedDatasetSpec) -> "SharedDataset":
+        return cls(spec=spec, shm=open_shared_memory(spec.name), owner=False)
+
+    @property
+    def values(self) -> np.ndarray:
+        if self._values is None:
+            raise ValueError(f"Shared dataset {self.spec.name} is closed")
+        return self._values
+
+    def column(self, col: str) -> np.ndarray:
+        return self.values[:, self.spec.columns.index(col)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """zero-copy DataFrame over the shared block"""
+        index = pd.Index(self.spec.index, name=self.spec.index_name)
+        return pd.DataFrame(
+            self.values, index=index, columns=self.spec.columns, copy=False
+        )
+
+    def close(self) -> None:
+        """detach, and unlink if this is the owner. Views handed out must be dropped first,
+        otherwise the segment stays mapped in this process until they are (it is still
+        unlinked).
+        """
+        self._values = None
+        self._finalizer()
+
+    def __enter__(self) -> "SharedDataset":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_shared_memory(name: str) -> SharedMemory:
+    """attach to an existing segment without making this process responsible for it.
+    Before python 3.13 attaching always registers with the resource tracker, that is
+    harmless for pool workers since they share the owner's tracker.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)  # type: ignore
+    return SharedMemory(name=name)
+
+
+def release_shared_memory(shm: SharedMemory, owner: bool) -> None:
+    try:
+        shm.close()
+    except BufferError:
+        logger.warning(f"Views into shared dataset {shm.name} still exist, not unmapped")
+    if owner:
+        try:
+            shm.unlink()
+            logger.info(f"Removed shared dataset {shm.name}")
+        except FileNotFoundError:
+            pass
+
+
+# per worker process state, set by init_worker
+_worker_dataset: Optional[SharedDataset] = None
+_worker_frame: Optional[pd.DataFrame] = None
+
+
+def init_worker(spec: SharedDatasetSpec) -> None:
+    global _worker_dataset, _worker_frame
+    _worker_dataset = SharedDataset.attach(spec)
+    _worker_frame = _worker_dataset.to_frame()
+    # forked workers inherit the parent's global RNG state, policies like RandomPolicy
+    # would make the same picks in every worker
+    np.random.seed()
+
+
+def call_with_frame(fn: Callable[[pd.DataFrame, Any], Any], arg: Any) -> Any:
+    assert _worker_frame is not None, "worker was not initialized with init_worker"
+    return fn(_worker_frame, arg)
+
+
+def pool_map(
+    dataset: SharedDataset,
+    fn: Callable[[pd.DataFrame, Any], Any],
+    args: Iterable[Any],
+    num_workers: Optional[int] = None,
+) -> List[Any]:
+    """runs fn(df, arg) for each arg on num_workers processes that all read the one shared
+    copy of the data. fn must be picklable (a module level function or partial of one).
+
+    Args:
+        dataset (SharedDataset): data to share, df in fn is a zero-copy view of it
+        fn (Callable[[pd.DataFrame, Any], Any]): work for one arg
+        args (Iterable[Any]): one task per element
+        num_workers (Optional[int], optional): processes, Defaults to os.cpu_count()
+
+    Returns:
+        List[Any]: fn results in the order of args
+    """
+    with Pool(num_workers, initializer=init_worker, initargs=(dataset.spec,)) as pool:
+        return pool.map(partial(call_with_frame, fn), args)
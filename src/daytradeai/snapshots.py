@@ -0,0 +1,206 @@
+"""Versioned store for preprocessed data.
+
+Each save commits a version named by its latest day. A version is a chain of parquet files:
+a full base followed by deltas holding only the rows that are new or changed since the
+previous version. The manifest records the chain of every retained version, so any of
+them can be rebuilt. The latest version is also kept materialized in latest.parquet, so
+loading it is one file read as before. The manifest is saved before latest.parquet is
+replaced, and latest.parquet records its version in the parquet metadata; if a crash
+leaves it behind the manifest, the latest version is rebuilt from its chain instead.
+
+A base is written instead of a delta for the first version, when the columns change, when
+rows were removed, when the delta would hold most of the rows (i.e, yfinance adjusted the
+whole price history) and every compact_every versions, so chains stay short. Only the
+last retain_versions versions are kept, files no other version needs are deleted.
+"""
+
+import glob
+import json
+import os
+from logging import getLogger, basicConfig, INFO
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+MANIFEST = "manifest.json"
+LATEST = "latest.parquet"
+VERSION_KEY = b"daytradeai_snapshot_version"
+
+
+def get_store_dir(cfg: Dict[str, Any]) -> str:
+    return os.path.join(cfg["data_dir"], "snapshots")
+
+
+def get_manifest_path(cfg: Dict[str, Any]) -> str:
+    return os.path.join(get_store_dir(cfg), MANIFEST)
+
+
+def has_snapshots(cfg: Dict[str, Any]) -> bool:
+    return os.path.exists(get_manifest_path(cfg))
+
+
+def load_manifest(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    fname = get_manifest_path(cfg)
+    if not os.path.exists(fname):
+        return dict(versions=[], next_file=0)
+    with open(fname) as fh:
+        return json.load(fh)
+
+
+def save_manifest(manifest: Dict[str, Any], cfg: Dict[str, Any]) -> None:
+    fname = get_manifest_path(cfg)
+    with open(fname + ".tmp", "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(fname + ".tmp", fname)
+
+
+def get_latest_path(cfg: Dict[str, Any]) -> str:
+    return os.path.join(get_store_dir(cfg), LATEST)
+
+
+def write_latest(df: pd.DataFrame, version: str, cfg: Dict[str, Any]) -> None:
+    table = pa.Table.from_pandas(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[VERSION_KEY] = version.encode()
+    path = get_latest_path(cfg)
+    pq.write_table(table.replace_schema_metadata(metadata), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def get_latest_file_version(cfg: Dict[str, Any]) -> Optional[str]:
+    """version latest.parquet holds, None if it is missing or has none"""
+    path = get_latest_path(cfg)
+    if not os.path.exists(path):
+        return None
+    version = (pq.read_schema(path).metadata or {}).get(VERSION_KEY)
+    return None if version is None else version.decode()
+
+
+def list_versions(cfg: Dict[str, Any]) -> List[str]:
+    return [entry["version"] for entry in load_manifest(cfg)["versions"]]
+
+
+def get_changed_rows(df: pd.DataFrame, df_prev: pd.DataFrame) -> pd.Index:
+    """index of rows in df that are not in df_prev or differ from it, NaN equals NaN"""
+    common = df.index.intersection(df_prev.index)
+    cur = df.loc[common]
+    prev = df_prev.loc[common, df.columns]
+    same = (cur == prev) | (cur.isna() & prev.isna())
+    changed = common[~same.all(axis=1).to_numpy()]
+    return df.index.difference(df_prev.index).union(changed)
+
+
+def commit_snapshot(df: pd.DataFrame, cfg: Dict[str, Any]) -> str:
+    """saves df as the version named by its latest day, committing the same day twice
+    replaces that version.
+
+    Args:
+        df (pd.DataFrame): preprocessed data
+        cfg (Dict[str, Any]): preprocess config, uses data_dir and snapshots
+
+    Returns:
+        str: the version
+    """
+    store_dir = get_store_dir(cfg)
+    os.makedirs(store_dir, exist_ok=True)
+    snapshot_cfg = cfg["snapshots"]
+    version = df.index.max().strftime("%Y-%m-%d")
+    manifest = load_manifest(cfg)
+    versions = manifest["versions"]
+
+    chain: List[str] = []
+    delta = df
+    if versions:
+        df_prev = load_snapshot(cfg)
+        prev_chain = versions[-1]["files"]
+        can_delta = [
+            list(df.columns) == list(df_prev.columns),
+            df_prev.dtypes.equals(df.dtypes),
+            df_prev.index.isin(df.index).all(),
+            len(prev_chain) < snapshot_cfg["compact_every"],
+        ]
+        if all(can_delta):
+            rows = get_changed_rows(df=df, df_prev=df_prev)
+            if len(rows) <= len(df) // 2:
+                chain = list(prev_chain)
+                delta = df.loc[rows]
+        del df_prev
+
+    kind = "delta" if chain else "base"
+    fname = f"{kind}-{manifest['next_file']:05d}-{version}.parquet"
+    logger.info(f"Committing {len(delta)} of {len(df)} rows to {fname}")
+    delta.to_parquet(os.path.join(store_dir, fname))
+    manifest["next_file"] += 1
+    chain.append(fname)
+
+    versions = [entry for entry in versions if entry["version"] != version]
+    versions.append(dict(version=version, files=chain, num_rows=len(df)))
+    num_dropped = max(len(versions) - snapshot_cfg["retain_versions"], 0)
+    manifest["versions"] = versions[num_dropped:]
+    # manifest first, a crash before latest.parquet is replaced leaves it behind, which
+    # load_snapshot detects from its version
+    save_manifest(manifest, cfg)
+    write_latest(df, version=version, cfg=cfg)
+    remove_unused_files(manifest, cfg)
+    return version
+
+
+def remove_unused_files(manifest: Dict[str, Any], cfg: Dict[str, Any]) -> None:
+    store_dir = get_store_dir(cfg)
+    used = {fname for entry in manifest["versions"] for fname in entry["files"]}
+    for path in glob.glob(os.path.join(store_dir, "base-*.parquet")) + glob.glob(
+        os.path.join(store_dir, "delta-*.parquet")
+    ):
+        if os.path.basename(path) not in used:
+            logger.info(f"Removing snapshot file {path}")
+            os.remove(path)
+
+
+def load_snapshot(
+    cfg: Dict[str, Any],
+    version: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """loads a version, the latest if version is None
+
+    Args:
+        cfg (Dict[str, Any]): preprocess config
+        version (Optional[str], optional): a version from list_versions. Defaults to None.
+        columns (Optional[List[str]], optional): only read these. Defaults to None, all.
+
+    Returns:
+        pd.DataFrame: the preprocessed data as it was committed
+    """
+    store_dir = get_store_dir(cfg)
+    versions = load_manifest(cfg)["versions"]
+    if not versions:
+        raise FileNotFoundError(f"No preprocessed snapshots found in {store_dir}")
+    if version is None:
+        version = versions[-1]["version"]
+    if version == versions[-1]["version"]:
+        if get_latest_file_version(cfg) == version:
+            logger.info(f"Loading latest preprocessed snapshot {version}")
+            return pd.read_parquet(get_latest_path(cfg), columns=columns)
+        logger.warning(f"{LATEST} is not at the latest version {version}, rebuilding it")
+    entries = [entry for entry in versions if entry["version"] == version]
+    if not entries:
+        raise FileNotFoundError(
+            f"No preprocessed snapshot {version} in {store_dir}, have {list_versions(cfg)}"
+        )
+    files = entries[0]["files"]
+    logger.info(f"Rebuilding preprocessed snapshot {version} from {len(files)} files")
+    df = pd.read_parquet(os.path.join(store_dir, files[0]), columns=columns)
+    for fname in files[1:]:
+        delta = pd.read_parquet(os.path.join(store_dir, fname), columns=columns)
+        df = pd.concat([df.drop(index=delta.index, errors="ignore"), delta])
+    return df.sort_index()
@@ -0,0 +1,181 @@
+"""Time-series cross validation over the preprocessed data.
+
+Rows are days. Two kinds of leakage are kept out of the training rows of a fold:
+
+    purge    the label of day t is the pdiff from t to t+1 (shift(-1)), so the last
+             label_horizon training days before a test window are dropped, their labels
+             would use prices inside it.
+    embargo  the features of day t look back up to anchor + lag days, so the first
+             embargo training days after a test window are dropped, their features
+             would use prices inside it. Only purged k-fold has training days after
+             the test window.
+
+The features, labels and returns are copied once into C ordered arrays, days x columns,
+so every row range of a fold is a contiguous view of them and folds cost no memory.
+"""
+
+from dataclasses import dataclass
+from logging import getLogger, basicConfig, INFO
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+basicConfig(
+    level=INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M",
+)  # remove seconds and milliseconds
+logger = getLogger(__name__)
+
+LABEL_HORIZON = 1  # labels are the next day pdiff
+
+
+def get_max_lookback(anchor_and_lags: Dict[int, List[int]]) -> int:
+    """days before a row its features can use, the embargo for the preprocess config"""
+    return max(anchor + lag for anchor, lags in anchor_and_lags.items() for lag in lags)
+
+
+@dataclass(frozen=True)
+class Fold:
+    """row ranges of one fold, train is in time order and may have a gap for the test"""
+
+    train: Tuple[slice, ...]
+    test: slice
+
+    def get_test_ilocs(self) -> Tuple[int, int]:
+        """start_iloc and end_iloc (inclusive) for the evaluate functions"""
+        return self.test.start, self.test.stop - 1
+
+    @property
+    def num_train(self) -> int:
+        return sum(rows.stop - rows.start for rows in self.train)
+
+
+@dataclass(frozen=True)
+class FoldView:
+    """views of the rows of one range, nothing is copied"""
+
+    x: np.ndarray  # days x features
+    y: np.ndarray  # days x tickers, label_{ticker}
+    returns: np.ndarray  # days x tickers, label_{ticker}_pdiff_1f
+    index: pd.Index
+
+
+def get_train_ranges(
+    num_rows: int, test: slice, purge: int, embargo: int, train_start: int = 0
+) -> Tuple[slice, ...]:
+    before = slice(train_start, max(test.start - purge, train_start))
+    after = slice(min(test.stop + embargo, num_rows), num_rows)
+    return tuple(rows for rows in [before, after] if rows.stop > rows.start)
+
+
+def get_walk_forward_folds(
+    num_rows: int,
+    num_folds: int,
+    test_size: int,
+    min_train_size: int = 1,
+    max_train_size: Optional[int] = None,
+    purge: int = LABEL_HORIZON,
+) -> List[Fold]:
+    """num_folds consecutive test windows of test_size days ending at the last row, each
+    trained on the days before it (all of them, or the last max_train_size).
+
+    Args:
+        num_rows (int): days in the data
+        num_folds (int): test windows
+        test_size (int): days per test window, i.e, 250 for a trading year
+        min_train_size (int, optional): folds with fewer training days are dropped.
+            Defaults to 1.
+        max_train_size (Optional[int], optional): rolling instead of expanding training
+            window. Defaults to None.
+        purge (int, optional): see module docstring. Defaults to LABEL_HORIZON.
+
+    Returns:
+        List[Fold]: oldest test window first
+    """
+    folds = []
+    for fold_idx in range(num_folds, 0, -1):
+        test_stop = num_rows - (fold_idx - 1) * test_size
+        test = slice(test_stop - test_size, test_stop)
+        if test.start < 0:
+            continue
+        train_start = 0
+        if max_train_size is not None:
+            train_start = max(test.start - purge - max_train_size, 0)
+        # nothing after the test window, so no embargo
+        train = get_train_ranges(
+            test.start, test=test, purge=purge, embargo=0, train_start=train_start
+        )
+        fold = Fold(train=train, test=test)
+        if fold.num_train >= min_train_size:
+            folds.append(fold)
+    return folds
+
+
+def get_purged_kfold_folds(
+    num_rows: int, num_folds: int, embargo: int, purge: int = LABEL_HORIZON
+) -> List[Fold]:
+    """num_folds contiguous test windows covering all rows, each trained on the rest less
+    the purge before and the embargo after the test window.
+
+    Args:
+        num_rows (int): days in the data
+        num_folds (int): folds
+        embargo (int): see module docstring, i.e, get_max_lookback(anchor_and_lags)
+        purge (int, optional): see module docstring. Defaults to LABEL_HORIZON.
+
+    Returns:
+        List[Fold]: in time order of the test windows
+    """
+    bounds = np.linspace(0, num_rows, num_folds + 1).astype(int)
+    return [
+        Fold(
+            train=get_train_ranges(
+                num_rows, test=slice(start, stop), purge=purge, embargo=embargo
+            ),
+            test=slice(start, stop),
+        )
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+class SplitData:
+    """features, labels and next day returns of the preprocessed data as contiguous arrays,
+    built once, sliced per fold.
+    """
+
+    def __init__(self, df: pd.DataFrame, tickers: List[str], feature_cols: List[str]):
+        self.index = df.index
+        self.tickers = tickers
+        self.feature_cols = feature_cols
+        self.x = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=np.float64))
+        self.y = np.ascontiguousarray(
+            df[[f"label_{ticker}" for ticker in tickers]].to_numpy(dtype=np.float64)
+        )
+        self.returns = np.ascontiguousarray(
+            df[[f"label_{ticker}_pdiff_1f" for ticker in tickers]].to_numpy(
+                dtype=np.float64
+            )
+        )
+        logger.info(
+            f"Split data: {len(df)} days, {len(feature_cols)} features, "
+            f"{len(tickers)} tickers"
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_view(self, rows: slice) -> FoldView:
+        return FoldView(
+            x=self.x[rows],
+            y=self.y[rows],
+            returns=self.returns[rows],
+            index=self.index[rows],
+        )
+
+    def iter_folds(self, folds: List[Fold]) -> Iterator[Tuple[List[FoldView], FoldView]]:
+        """train views (one per contiguous range) and the test view of each fold"""
+        for fold in folds:
+            yield [self.get_view(rows) for rows in fold.train], self.get_view(fold.test)
@@ -1,6 +1,6 @@
 # The list of stocks that are part of the Dow Jones Industrial Average index
 # and their weights, as of 2025-01-15
-from typing import List
+from typing import Dict, List
 
 # removing two stocks added during the last 5 years
 dow_jones_stocks = [
@@ -163,3 +163,10 @@ def get_tickers(group: str, num_tickers: int = -1) -> List[str]:
     tickers = [el["Ticker"] for el in _group2stocks[group]]
     tickers = tickers[0:num_tickers] if num_tickers > 0 else tickers
     return tickers
+
+
+def get_ticker_weights(group: str) -> Dict[str, float]:
+    """index weights listed for the group, tickers without one are left out"""
+    return {
+        el["Ticker"]: float(el["Weight"]) for el in _group2stocks[group] if "Weight" in el
+    }
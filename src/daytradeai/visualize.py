@@ -1,8 +1,9 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import daytradeai.cache as cache
 import daytradeai.preprocess as preprocess
 import daytradeai.policies as policies
 import daytradeai.evaluate as evaluate
@@ -75,6 +76,12 @@ def hist_pdiff_yesterday_vs_today(
     return result
 
 
+def get_random_policy(
+    stocks: List[str], seed: Optional[int], run: int
+) -> policies.RandomPolicy:
+    return policies.RandomPolicy(stocks=stocks, seed=None if seed is None else seed + run)
+
+
 def control_random_daily(
     df: pd.DataFrame,
     p_cfg: Dict[str, Any],
@@ -82,22 +89,33 @@ def control_random_daily(
     T: int = 250,
     num_rand: int = 10,
     figsize: Tuple[int, int] = (10, 5),
+    seed: Optional[int] = None,
+    backtest_cache: Optional[cache.BacktestCache] = None,
 ) -> None:
+    """seed makes the random runs reproducible (run ii uses seed + ii), and so cacheable"""
     start_iloc = -T
     end_iloc = -1
 
     ctrl_policy = policies.ControlPolicy(index_name=p_cfg["index_name"])
-    random_policy = policies.RandomPolicy(stocks=stocks)
 
     plt.figure(figsize=figsize)
     control_vals, _ = evaluate.get_asset_values_and_stocks(
-        df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=ctrl_policy
+        df=df,
+        start_iloc=start_iloc,
+        end_iloc=end_iloc,
+        policy=ctrl_policy,
+        backtest_cache=backtest_cache,
     )
     plt.plot(control_vals, "r", label="control")
 
     for ii in range(num_rand):
+        random_policy = get_random_policy(stocks=stocks, seed=seed, run=ii)
         random_vals, _ = evaluate.get_asset_values_and_stocks(
-            df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=random_policy
+            df=df,
+            start_iloc=start_iloc,
+            end_iloc=end_iloc,
+            policy=random_policy,
+            backtest_cache=backtest_cache,
         )
 
         label = "random" if ii == 0 else None
@@ -121,22 +139,31 @@ def hist_random_vs_control(
     T: int = 250,
     num_rand: int = 1000,
     figsize: Tuple[int, int] = (10, 5),
+    seed: Optional[int] = None,
+    backtest_cache: Optional[cache.BacktestCache] = None,
 ) -> None:
-
+    """seed makes the random runs reproducible (run ii uses seed + ii), and so cacheable"""
     start_iloc = -T
     end_iloc = -1
 
-    random_policy = policies.RandomPolicy(stocks=stocks)
     ctrl_policy = policies.ControlPolicy(index_name=p_cfg["index_name"])
     ctrl_final = evaluate.get_asset_final_value(
-        df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=ctrl_policy
+        df=df,
+        start_iloc=start_iloc,
+        end_iloc=end_iloc,
+        policy=ctrl_policy,
+        backtest_cache=backtest_cache,
     )
 
     random_finals = [
         evaluate.get_asset_final_value(
-            df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=random_policy
+            df=df,
+            start_iloc=start_iloc,
+            end_iloc=end_iloc,
+            policy=get_random_policy(stocks=stocks, seed=seed, run=ii),
+            backtest_cache=backtest_cache,
         )
-        for _ in range(num_rand)
+        for ii in range(num_rand)
     ]
     random_normalized = np.array(random_finals) / ctrl_final
 
@@ -148,7 +175,11 @@ def hist_random_vs_control(
 
 
 def control_max_YTD_daily(
-    df: pd.DataFrame, p_cfg: Dict[str, Any], stocks: List[str], T: int = 240
+    df: pd.DataFrame,
+    p_cfg: Dict[str, Any],
+    stocks: List[str],
+    T: int = 240,
+    backtest_cache: Optional[cache.BacktestCache] = None,
 ) -> None:
     start_iloc = -T
     end_iloc = -1
@@ -160,12 +191,20 @@ def control_max_YTD_daily(
 
     plt.figure(figsize=(10, 5))
     control_vals, _ = evaluate.get_asset_values_and_stocks(
-        df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=ctrl_policy
+        df=df,
+        start_iloc=start_iloc,
+        end_iloc=end_iloc,
+        policy=ctrl_policy,
+        backtest_cache=backtest_cache,
     )
     plt.plot(control_vals, "r", label="control")
 
     max_feat_vals, max_feat_stocks = evaluate.get_asset_values_and_stocks(
-        df=df, start_iloc=start_iloc, end_iloc=end_iloc, policy=max_year_return_policy
+        df=df,
+        start_iloc=start_iloc,
+        end_iloc=end_iloc,
+        policy=max_year_return_policy,
+        backtest_cache=backtest_cache,
     )
     plt.plot(max_feat_vals, "g")
 
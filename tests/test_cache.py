@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import daytradeai.evaluate as evaluate
+import daytradeai.policies as policies
+from daytradeai.cache import BacktestCache
+
+
+@pytest.fixture
+def df_perf():
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2024-01-01", periods=60, freq="D", name="Date")
+    return pd.DataFrame(
+        rng.normal(size=(60, 3)),
+        index=index,
+        columns=["label_AAA_pdiff_1f", "label_BBB_pdiff_1f", "label_idx_pdiff_1f"],
+    )
+
+
+def test_backtest_cache(df_perf, tmp_path, monkeypatch):
+    """A repeat evaluation is read back, new data or parameters are evaluated again."""
+    backtest_cache = BacktestCache(cache_dir=str(tmp_path), max_mb=1)
+    policy = policies.RandomPolicy(stocks=["AAA", "BBB"], seed=7)
+    expected = evaluate.get_asset_values_and_stocks(
+        df=df_perf, start_iloc=-30, end_iloc=-1, policy=policy
+    )
+    first = evaluate.get_asset_values_and_stocks(
+        df=df_perf,
+        start_iloc=-30,
+        end_iloc=-1,
+        policy=policy,
+        backtest_cache=backtest_cache,
+    )
+    assert first == expected
+    assert len(os.listdir(tmp_path)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("evaluated instead of read from the cache")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(evaluate, "get_next_value_and_stock", fail)
+        cached = evaluate.get_asset_values_and_stocks(
+            df=df_perf,
+            start_iloc=30,
+            end_iloc=59,
+            policy=policies.RandomPolicy(stocks=["AAA", "BBB"], seed=7),
+            backtest_cache=backtest_cache,
+        )
+        assert cached == expected
+        final = evaluate.get_asset_final_value(
+            df=df_perf,
+            start_iloc=-30,
+            end_iloc=-1,
+            policy=policy,
+            backtest_cache=backtest_cache,
+        )
+        assert final == expected[0][-1]
+
+    df_new = df_perf.copy()
+    df_new.iloc[-1, 0] += 1.0
+    evaluate.get_asset_values_and_stocks(
+        df=df_new,
+        start_iloc=-30,
+        end_iloc=-1,
+        policy=policy,
+        backtest_cache=backtest_cache,
+    )
+    evaluate.get_asset_values_and_stocks(
+        df=df_perf,
+        start_iloc=-30,
+        end_iloc=-1,
+        policy=policies.RandomPolicy(stocks=["AAA", "BBB"], seed=8),
+        backtest_cache=backtest_cache,
+    )
+    evaluate.get_asset_values_and_stocks(
+        df=df_perf,
+        start_iloc=-30,
+        end_iloc=-1,
+        policy=policies.RandomPolicy(stocks=["AAA", "BBB"]),
+        backtest_cache=backtest_cache,
+    )
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_backtest_cache_eviction(df_perf, tmp_path):
+    """Least recently used results are removed once over the size limit."""
+    backtest_cache = BacktestCache(cache_dir=str(tmp_path), max_mb=3000 / 2**20)
+    keys = []
+    for lag in range(1, 6):
+        policy = policies.ControlPolicy(index_name="idx")
+        key = backtest_cache.get_key(df_perf, policy, start_iloc=lag, end_iloc=59, v0=1.0)
+        backtest_cache.put(key, vals=[1.0] * 60, stocks=["idx"] * 59)
+        keys.append(key)
+        if lag == 2:
+            os.utime(backtest_cache.get_path(keys[0]), (0, 0))
+    assert backtest_cache.get_total_bytes() <= 3000
+    assert backtest_cache.get(keys[0]) is None
+    assert backtest_cache.get(keys[-1]) == ([1.0] * 60, ["idx"] * 59)
+
+
+def test_backtest_cache_column_overwritten(df_perf, tmp_path):
+    """Overwriting a column the evaluation reads, in place, is not served the old result."""
+    backtest_cache = BacktestCache(cache_dir=str(tmp_path), max_mb=1)
+    policy = policies.ControlPolicy(index_name="idx")
+    first = evaluate.get_asset_final_value(
+        df=df_perf,
+        start_iloc=-30,
+        end_iloc=-1,
+        policy=policy,
+        backtest_cache=backtest_cache,
+    )
+    df_perf["label_idx_pdiff_1f"] = df_perf["label_idx_pdiff_1f"] + 1.0
+    expected = evaluate.get_asset_final_value(
+        df=df_perf, start_iloc=-30, end_iloc=-1, policy=policy
+    )
+    second = evaluate.get_asset_final_value(
+        df=df_perf,
+        start_iloc=-30,
+        end_iloc=-1,
+        policy=policy,
+        backtest_cache=backtest_cache,
+    )
+    assert second == expected != first
+    with pytest.raises(IndexError):
+        evaluate.get_asset_final_value(
+            df=df_perf,
+            start_iloc=-61,
+            end_iloc=-1,
+            policy=policy,
+            backtest_cache=backtest_cache,
+        )
+
+
+@pytest.mark.parametrize(
+    "start_iloc, end_iloc, num_vals",
+    [(-30, 59, 91), (30, -1, 1), (-30, -1, 31), (30, 59, 31)],
+)
+def test_backtest_cache_mixed_sign_ilocs(
+    df_perf, tmp_path, start_iloc, end_iloc, num_vals
+):
+    """Ranges visiting different days do not share a result, the same days do."""
+    backtest_cache = BacktestCache(cache_dir=str(tmp_path), max_mb=1)
+    for start, end in [(-30, 59), (30, -1), (-30, -1), (30, 59)]:
+        evaluate.get_asset_values_and_stocks(
+            df=df_perf,
+            start_iloc=start,
+            end_iloc=end,
+            policy=policies.RandomPolicy(stocks=["AAA", "BBB"], seed=1),
+            backtest_cache=backtest_cache,
+        )
+    assert len(os.listdir(tmp_path)) == 3  # (-30, -1) and (30, 59) are the same days
+    policy = policies.RandomPolicy(stocks=["AAA", "BBB"], seed=1)
+    expected = evaluate.get_asset_values_and_stocks(
+        df=df_perf, start_iloc=start_iloc, end_iloc=end_iloc, policy=policy
+    )
+    policy.reset()
+    cached = evaluate.get_asset_values_and_stocks(
+        df=df_perf,
+        start_iloc=start_iloc,
+        end_iloc=end_iloc,
+        policy=policy,
+        backtest_cache=backtest_cache,
+    )
+    assert cached == expected
+    assert len(cached[0]) == num_vals
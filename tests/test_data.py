@@ -4,7 +4,7 @@ import pandas as pd
 import shutil
 from tempfile import mkdtemp
 
-from daytradeai.data import get_downloaded_data
+from daytradeai.data import get_downloaded_data, get_downloaded_prices
 
 
 @pytest.fixture
@@ -55,3 +55,19 @@ def test_get_download_data(temp_parquet_dir, df1_test_data, df2_test_data, df_ex
         if df_result is None:
             pytest.fail("get_downloaded_data returned None")
         pd.testing.assert_frame_equal(df_result, df_expected_combined_data)
+
+
+def test_newest_download_wins(temp_parquet_dir):
+    """Where downloads overlap, both readers take the values of the newest file."""
+    columns = pd.MultiIndex.from_tuples([("Open", "XYZ")], names=["Price", "Ticker"])
+    index = pd.to_datetime(["2024-01-02", "2024-01-03"])
+    newer = pd.DataFrame([[2.0], [3.0]], index=index, columns=columns)
+    older = pd.DataFrame([[1.0], [9.0]], index=index - pd.Timedelta(days=1), columns=columns)
+    newer.to_parquet(f"{temp_parquet_dir}/2024-01-03.parquet")
+    older.to_parquet(f"{temp_parquet_dir}/2024-01-02.parquet")
+
+    with patch("daytradeai.data.get_stock_download_dir", return_value=temp_parquet_dir):
+        df_data = get_downloaded_data(cfg=dict())
+        df_prices = get_downloaded_prices(cfg=dict(), price="Open", tickers=["XYZ"])
+    assert df_data.iloc[:, 0].tolist() == [1.0, 2.0, 3.0]
+    assert df_prices["XYZ"].tolist() == [1.0, 2.0, 3.0]
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import daytradeai.evaluate as evaluate
+from daytradeai.indices import (
+    EWCovariance,
+    get_ew_volatility,
+    get_index_performance,
+    get_index_weights,
+)
+
+
+@pytest.fixture
+def df_prices():
+    """Random walk prices for three stocks and cash."""
+    rng = np.random.default_rng(4)
+    index = pd.date_range("2024-01-01", periods=100, freq="D")
+    prices = 50.0 * np.exp(np.cumsum(rng.normal(scale=0.02, size=(100, 3)), axis=0))
+    df = pd.DataFrame(prices, index=index, columns=["AAA", "BBB", "CCC"])
+    df["cash"] = 1.0
+    return df
+
+
+def test_ew_covariance_matches_pandas():
+    """The streaming update gives pandas' adjust=False, biased EW covariance."""
+    rng = np.random.default_rng(5)
+    returns = pd.DataFrame(rng.normal(size=(80, 3)))
+    engine = EWCovariance(num_assets=3, halflife=10)
+    for row in returns.to_numpy():
+        engine.update(row)
+    ewm = returns.ewm(alpha=engine.alpha, adjust=False)
+    np.testing.assert_allclose(engine.mean, ewm.mean().iloc[-1], atol=1e-12)
+    np.testing.assert_allclose(engine.cov, ewm.cov(bias=True).loc[79], atol=1e-12)
+
+
+def test_ew_volatility_resumes_from_checkpoint(tmp_path, df_prices):
+    """Saving after 60 days and resuming gives the same volatilities as one pass."""
+    returns = df_prices.pct_change()
+    expected = get_ew_volatility(returns, halflife=10)
+    engine = EWCovariance(num_assets=4, halflife=10)
+    get_ew_volatility(returns.iloc[:60], halflife=10, engine=engine)
+    engine.save(str(tmp_path / "ewcov.npz"))
+    engine = EWCovariance.load(str(tmp_path / "ewcov.npz"))
+    resumed = get_ew_volatility(returns, halflife=10, engine=engine)
+    pd.testing.assert_frame_equal(resumed, expected.iloc[60:])
+
+
+def test_index_performance(df_prices):
+    """Equal weighting is the row mean, price weighting is the DJIA style return."""
+    stocks = list(df_prices.columns)
+    pdiff_1f = (100.0 * df_prices.pct_change()).shift(-1)
+    equal = get_index_performance(df_prices, stocks, weighting="equal", group="dowjones")
+    pd.testing.assert_series_equal(equal, pdiff_1f.mean(axis=1), check_freq=False)
+
+    price = get_index_performance(df_prices, stocks, weighting="price", group="dowjones")
+    total = df_prices.sum(axis=1)
+    expected = 100.0 * (total.shift(-1) - total) / total
+    pd.testing.assert_series_equal(price, expected, check_freq=False)
+
+    invvol = get_index_performance(
+        df_prices, stocks, weighting="invvol", group="dowjones"
+    )
+    assert np.isnan(invvol.iloc[0]) and invvol.iloc[1:-1].notna().all()
+
+
+def test_cap_weights_on_last_day(df_prices):
+    """Cap weights on the last day are the listed Weight fields."""
+    df = df_prices.rename(columns=dict(AAA="GS", BBB="UNH"))
+    stocks = ["GS", "UNH", "cash"]
+    weights = get_index_weights(df, stocks, weighting="cap", group="dowjones")
+    assert weights.iloc[-1].tolist() == pytest.approx([8.26, 7.86, 0.0])
+    with pytest.raises(ValueError, match="group is required"):
+        evaluate.get_index_perf(df, stocks, weighting="cap")
+
+
+def test_cap_weights_need_a_listed_weight(df_prices, caplog):
+    """Cap weighting fails without any listed weight, and warns about stocks without one."""
+    with pytest.raises(ValueError, match="No stock has a Weight field"):
+        get_index_performance(df_prices, ["AAA", "cash"], weighting="cap", group="spmid")
+    df = df_prices.rename(columns=dict(AAA="GS"))
+    index_perf = get_index_performance(
+        df, ["GS", "BBB", "cash"], weighting="cap", group="dowjones"
+    )
+    assert index_perf.iloc[:-1].notna().all()
+    assert "['BBB']" in caplog.text
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import daytradeai.evaluate as evaluate
+import daytradeai.kernels as kernels
+import daytradeai.policies as policies
+from daytradeai.preprocess import get_feat_name
+
+
+STOCKS = ["AAA", "BBB", "CCC", "DDD"]
+
+
+@pytest.fixture
+def df_perf():
+    """Random scores and next day percent changes, with a few missing scores."""
+    rng = np.random.default_rng(1)
+    index = pd.date_range("2024-01-01", periods=120, freq="D")
+    df = pd.DataFrame(index=index)
+    for stock in STOCKS:
+        feat = get_feat_name(col=stock, feat="pdiff", anchor=0, lag=5)
+        df[feat] = rng.normal(scale=3.0, size=len(index))
+        df[f"label_{stock}_pdiff_1f"] = rng.normal(scale=2.0, size=len(index))
+    df.iloc[10:12, 0] = np.nan
+    return df
+
+
+@pytest.mark.parametrize(
+    "policy_cls, params",
+    [
+        (policies.HoldPolicy, [5]),
+        (policies.StopLossPolicy, [2.0]),
+        (policies.SwitchMarginPolicy, [1.5]),
+    ],
+)
+def test_stateful_run_matches_reference(df_perf, policy_cls, params):
+    """The compiled loop gives the same values and picks as the per day evaluate loop."""
+    policy = policy_cls(
+        df=df_perf, stocks=STOCKS, feat="pdiff", anchor=0, lag=5, params=params
+    )
+    ref_vals, ref_stocks = evaluate.get_asset_values_and_stocks(
+        df=df_perf, start_iloc=-100, end_iloc=-1, policy=policy
+    )
+    vals, stocks = policy.run(start_iloc=-100, end_iloc=-1)
+    assert stocks == ref_stocks
+    np.testing.assert_allclose(vals, ref_vals, rtol=1e-12)
+    assert len(set(stocks)) > 1
+
+
+def test_stateful_python_fallback_matches_compiled(df_perf):
+    """The uncompiled loop and step function agree with the compiled ones."""
+    policy = policies.StopLossPolicy(
+        df=df_perf, stocks=STOCKS, feat="pdiff", anchor=0, lag=5, params=[1.0]
+    )
+    vals, picks = kernels.run_policy(
+        kernels.stop_loss_step, policy.scores, policy.returns, policy.params, 20, 119, 1.0
+    )
+    compiled_vals, compiled_stocks = policy.run(start_iloc=20, end_iloc=119)
+    assert [STOCKS[pick] for pick in picks] == compiled_stocks
+    np.testing.assert_allclose(vals, compiled_vals, rtol=1e-12)
+
+
+def test_stateful_grid(df_perf):
+    """Each grid row gives the final value of a run with those parameters."""
+    policy = policies.HoldPolicy(
+        df=df_perf, stocks=STOCKS, feat="pdiff", anchor=0, lag=5, params=[1]
+    )
+    grid = np.array([[1], [3], [10]])
+    finals = policy.run_grid(start_iloc=-50, end_iloc=-1, param_grid=grid)
+    for row, final in zip(grid, finals):
+        policy.params = row.astype(float)
+        vals, _ = policy.run(start_iloc=-50, end_iloc=-1)
+        assert final == pytest.approx(vals[-1])
+    with pytest.raises(IndexError):
+        policy.run_grid(start_iloc=-121, end_iloc=-1, param_grid=grid)
+
+
+def test_stateful_out_of_range(df_perf):
+    """Out of range ilocs raise like the reference loop instead of wrapping around."""
+    policy = policies.HoldPolicy(
+        df=df_perf, stocks=STOCKS, feat="pdiff", anchor=0, lag=5, params=[1]
+    )
+    with pytest.raises(IndexError):
+        evaluate.get_asset_values_and_stocks(
+            df=df_perf, start_iloc=-130, end_iloc=-1, policy=policy
+        )
+    with pytest.raises(IndexError):
+        policy.run(start_iloc=-130, end_iloc=-1)
+    with pytest.raises(IndexError):
+        policy.run(start_iloc=0, end_iloc=120)
+
+
+@pytest.mark.parametrize("start_iloc, end_iloc", [(30, -30), (50, 20), (-5, -10)])
+def test_stateful_empty_range(df_perf, start_iloc, end_iloc):
+    """Ranges the evaluate loop does not enter give just v0, like the reference."""
+    policy = policies.HoldPolicy(
+        df=df_perf, stocks=STOCKS, feat="pdiff", anchor=0, lag=5, params=[1]
+    )
+    ref = evaluate.get_asset_values_and_stocks(
+        df=df_perf, start_iloc=start_iloc, end_iloc=end_iloc, policy=policy
+    )
+    assert ref == ([1.0], [])
+    assert policy.run(start_iloc=start_iloc, end_iloc=end_iloc) == ref
+    grid = np.array([[1], [3]])
+    finals = policy.run_grid(start_iloc=start_iloc, end_iloc=end_iloc, param_grid=grid)
+    np.testing.assert_array_equal(finals, [1.0, 1.0])
+
+
+def test_stateful_wrapping_range(df_perf):
+    """A range from a negative to a non negative iloc is rejected, not cut short."""
+    policy = policies.HoldPolicy(
+        df=df_perf, stocks=STOCKS, feat="pdiff", anchor=0, lag=5, params=[1]
+    )
+    with pytest.raises(ValueError, match="wrap around"):
+        policy.run(start_iloc=-10, end_iloc=45)
+    with pytest.raises(ValueError, match="wrap around"):
+        policy.run_grid(start_iloc=-10, end_iloc=45, param_grid=np.array([[1]]))
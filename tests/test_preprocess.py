@@ -0,0 +1,108 @@
+import glob
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from daytradeai.preprocess import (
+    ROLLING_FEATS,
+    add_lag_feat,
+    get_feat_name,
+    load_preprocessd,
+    preprocess_data,
+    preprocess_data_out_of_core,
+)
+
+
+@pytest.fixture
+def df_prices():
+    """Random walk prices for a few tickers plus a constant cash column."""
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2024-01-01", periods=300, freq="D")
+    prices = 100.0 + np.cumsum(rng.normal(size=(300, 3)), axis=0)
+    df = pd.DataFrame(prices, index=index, columns=["AAA", "BBB", "CCC"])
+    df.iloc[0:5, 1] = np.nan  # late listing
+    df["cash"] = 1.0
+    return df
+
+
+def pandas_rolling_feat(s: pd.Series, feat: str, window: int) -> pd.Series:
+    roll = s.rolling(window)
+    if feat == "rmean":
+        return roll.mean()
+    if feat == "rstd":
+        return roll.std()
+    if feat == "rzscore":
+        return (s - roll.mean()) / roll.std()
+    if feat == "rmin":
+        return roll.min()
+    if feat == "rmax":
+        return roll.max()
+    return 100.0 * (s - roll.max()) / roll.max()
+
+
+@pytest.mark.parametrize("feat", ROLLING_FEATS)
+def test_rolling_feats_match_pandas(df_prices, feat):
+    """Rolling features computed with the cumsum and block kernels agree with pandas."""
+    tickers = list(df_prices.columns)
+    anchor_and_lags = {0: [1, 2, 7, 30, 299, 300, 400], 1: [5]}
+    df = add_lag_feat(
+        df=df_prices.copy(), tickers=tickers, feat=feat, anchor_and_lags=anchor_and_lags
+    )
+    for anchor, lags in anchor_and_lags.items():
+        for lag in lags:
+            for col in tickers:
+                name = get_feat_name(col=col, feat=feat, anchor=anchor, lag=lag)
+                cur = df_prices[col].shift(anchor) if anchor > 0 else df_prices[col]
+                expected = pandas_rolling_feat(cur, feat=feat, window=lag)
+                expected = expected.replace([np.inf, -np.inf], np.nan)
+                pd.testing.assert_series_equal(
+                    df[name], expected, check_names=False, rtol=1e-8, atol=1e-8
+                )
+
+
+@pytest.fixture
+def temp_data_dirs(tmp_path):
+    """Download and preprocess configs pointing at a temporary directory."""
+    data_cfg = dict(stocks="test", data_dir=str(tmp_path / "downloads"))
+    preprocess_cfg = dict(
+        price="Open",
+        anchor_and_lags={0: [1, 2, 5], 1: [1]},
+        lag_feats=["diff", "pdiff", "rmean"],
+        data_dir=str(tmp_path / "preprocessed"),
+        memory_budget_mb=0,
+    )
+    return data_cfg, preprocess_cfg
+
+
+@pytest.mark.parametrize("weighting", ["equal", "price", "invvol"])
+def test_preprocess_out_of_core_matches_in_memory(temp_data_dirs, df_prices, weighting):
+    """Groups of one ticker give the same features and labels as preprocessing at once."""
+    data_cfg, preprocess_cfg = temp_data_dirs
+    preprocess_cfg.update(index_weighting=weighting, index_halflife=10)
+    tickers = ["AAA", "BBB", "CCC"]
+    df_raw = pd.concat(
+        dict(Open=df_prices[tickers], Close=df_prices[tickers] + 1.0),
+        axis=1,
+        names=["Price", "Ticker"],
+    )
+    download_dir = os.path.join(data_cfg["data_dir"], data_cfg["stocks"])
+    os.makedirs(download_dir)
+    df_raw.iloc[:200].to_parquet(os.path.join(download_dir, "2024-07-18.parquet"))
+    df_raw.iloc[150:].to_parquet(os.path.join(download_dir, "2024-10-26.parquet"))
+
+    with patch("daytradeai.preprocess.get_tickers", return_value=tickers):
+        expected = preprocess_data(
+            df=df_raw, data_cfg=data_cfg, preprocess_cfg=preprocess_cfg
+        )
+        output_dir = preprocess_data_out_of_core(
+            data_cfg=data_cfg, preprocess_cfg=preprocess_cfg
+        )
+    assert len(glob.glob(os.path.join(output_dir, "part-*.parquet"))) == len(tickers) + 1
+    df = load_preprocessd(preprocess_cfg)
+    assert sorted(df.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(
+        df[expected.columns], expected, check_freq=False, check_names=False, rtol=1e-12
+    )
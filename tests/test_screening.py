@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from daytradeai.screening import get_screening_rows, get_top_features, screen_features
+
+
+@pytest.fixture
+def df_screen():
+    """Two tickers, one feature each that predicts the label and one that is noise."""
+    rng = np.random.default_rng(3)
+    num_rows = 400
+    df = pd.DataFrame(index=pd.date_range("2024-01-01", periods=num_rows, freq="D"))
+    for ticker in ["AAA", "BBB"]:
+        pdiff_1f = rng.normal(size=num_rows)
+        pdiff_1f[-1] = np.nan
+        df[f"label_{ticker}_pdiff_1f"] = pdiff_1f
+        df[f"label_{ticker}"] = (pdiff_1f > 0).astype(int)
+        df[f"{ticker}_good_0d_1d"] = pdiff_1f + rng.normal(scale=0.5, size=num_rows)
+        df[f"{ticker}_noise_0d_1d"] = 500.0 + rng.normal(size=num_rows)
+        df.iloc[0:10, df.columns.get_loc(f"{ticker}_noise_0d_1d")] = np.nan
+    return df
+
+
+def test_screen_features(df_screen):
+    """Informative features rank first, statistics match direct per column computation."""
+    screening_cfg = dict(sort_by="mi", num_bins=5, num_folds=4, chunk_size=3)
+    ranking = screen_features(df_screen, ["AAA", "BBB"], screening_cfg)
+    assert set(get_top_features(ranking, top_k=2)) == {"AAA_good_0d_1d", "BBB_good_0d_1d"}
+
+    feat = "BBB_noise_0d_1d"
+    valid = df_screen[feat].notna() & df_screen["label_BBB_pdiff_1f"].notna()
+    x = df_screen.loc[valid, feat]
+    y = df_screen.loc[valid, "label_BBB"]
+    assert ranking.loc[feat, "num_rows"] == valid.sum()
+    assert ranking.loc[feat, "pb_corr"] == pytest.approx(np.corrcoef(x, y)[0, 1])
+
+    bins = pd.qcut(x, 5, labels=False)
+    p_joint = pd.crosstab(bins, y).to_numpy() / len(x)
+    p_outer = p_joint.sum(axis=1, keepdims=True) * p_joint.sum(axis=0, keepdims=True)
+    expected_mi = np.nansum(p_joint * np.log(p_joint / p_outer))
+    assert ranking.loc[feat, "mi"] == pytest.approx(expected_mi)
+    assert ranking.loc["AAA_good_0d_1d", "sign_stability"] == 1.0
+
+
+def test_screen_training_rows(df_screen):
+    """The held out last days do not change the ranking."""
+    screening_cfg = dict(
+        sort_by="mi", num_bins=5, num_folds=4, chunk_size=3, holdout_days=100
+    )
+    rows = get_screening_rows(len(df_screen), screening_cfg)
+    assert rows == slice(0, 299)
+    ranking = screen_features(df_screen, ["AAA", "BBB"], screening_cfg, rows=rows)
+    df_changed = df_screen.copy()
+    first_held_out = rows.stop
+    df_changed.iloc[first_held_out:] = 0.0
+    pd.testing.assert_frame_equal(
+        screen_features(df_changed, ["AAA", "BBB"], screening_cfg, rows=rows), ranking
+    )
+    pd.testing.assert_frame_equal(
+        screen_features(df_screen.iloc[rows], ["AAA", "BBB"], screening_cfg), ranking
+    )
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from daytradeai.models import save_model, train_ticker_model
+from daytradeai.preprocess import save_preprocessed
+from daytradeai.serve import PredictionServer
+
+TICKERS = ["AAA", "BBB", "CCC"]
+
+
+def make_df(num_rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(index=pd.date_range("2024-01-01", periods=num_rows, freq="D"))
+    for ticker in TICKERS:
+        pdiff_1f = rng.normal(size=num_rows)
+        pdiff_1f[-1] = np.nan
+        df[f"label_{ticker}_pdiff_1f"] = pdiff_1f
+        df[f"label_{ticker}"] = (pdiff_1f > 0).astype(int)
+        df[f"{ticker}_good_0d_1d"] = pdiff_1f + rng.normal(scale=0.5, size=num_rows)
+        df[f"{ticker}_noise_0d_1d"] = rng.normal(size=num_rows)
+    return df
+
+
+@pytest.fixture
+def serve_cfg(tmp_path):
+    cfg = dict(
+        preprocess=dict(data_dir=str(tmp_path / "preprocessed")),
+        model=dict(model_dir=str(tmp_path / "models")),
+        serve=dict(
+            host="127.0.0.1",
+            port=0,
+            listen_backlog=128,
+            max_batch=64,
+            max_wait_ms=20.0,
+            num_days=5,
+            reload_interval_s=3600.0,
+            request_timeout_s=10.0,
+        ),
+    )
+    df = make_df(num_rows=200, seed=0)
+    save_preprocessed(df, cfg["preprocess"])
+    feature_cols = ["AAA_good_0d_1d", "AAA_noise_0d_1d"]
+    save_model(train_ticker_model(df, TICKERS, feature_cols), cfg["model"])
+    return cfg, df
+
+
+def post(address, path, body):
+    host, port = address
+    request = Request(
+        f"http://{host}:{port}{path}",
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def get(address, path):
+    host, port = address
+    with urlopen(f"http://{host}:{port}{path}") as response:
+        return json.loads(response.read())
+
+
+def test_prediction_server(serve_cfg):
+    """Concurrent requests are batched and score the same as the model directly, new data
+    is picked up on reload.
+    """
+    cfg, df = serve_cfg
+    with PredictionServer(cfg=cfg, tickers=TICKERS) as server:
+        assert server.httpd.request_queue_size == 128
+        model = server.state.model
+        dates = [day.strftime("%Y-%m-%d") for day in df.index[-5:]]
+        bodies = []
+        for idx in range(40):
+            first = idx % 3
+            bodies.append(dict(tickers=TICKERS[first:], date=dates[idx % 5]))
+        with ThreadPoolExecutor(max_workers=len(bodies)) as pool:
+            results = list(
+                pool.map(lambda body: post(server.address, "/score", body), bodies)
+            )
+        for body, result in zip(bodies, results):
+            iloc = df.index.get_loc(pd.Timestamp(body["date"]))
+            expected = model.score(model.get_features(df, body["tickers"], iloc))
+            assert result["date"] == body["date"]
+            assert list(result["scores"]) == body["tickers"]
+            np.testing.assert_allclose(list(result["scores"].values()), expected)
+
+        pick = get(server.address, "/pick")
+        latest = post(server.address, "/score", dict())
+        assert pick["date"] == dates[-1]
+        assert pick["ticker"] == max(latest["scores"], key=latest["scores"].get)
+
+        stats = get(server.address, "/stats")
+        assert stats["requests"] == 42
+        assert stats["batches"] < 42
+        assert set(stats["latency_ms"]) == {"p50", "p90", "p99"}
+
+        assert not server.check_reload()
+        df_new = make_df(num_rows=201, seed=1)
+        time.sleep(0.01)
+        save_preprocessed(df_new, cfg["preprocess"])
+        assert server.check_reload()
+        assert get(server.address, "/pick")["date"] == "2024-07-19"
+
+        with pytest.raises(Exception, match="400"):
+            post(server.address, "/score", dict(tickers=["ZZZ"]))
+    assert not os.path.exists(os.path.join(cfg["model"]["model_dir"], "model.pkl.tmp"))
+
+
+def test_prediction_server_errors(serve_cfg, monkeypatch):
+    """Failures are answered with an error status and counted, the server keeps serving."""
+    cfg, _ = serve_cfg
+    PredictionServer(cfg=cfg, tickers=TICKERS).stop()  # never started
+
+    cfg["serve"]["request_timeout_s"] = 0.2
+    with PredictionServer(cfg=cfg, tickers=TICKERS) as server:
+        with pytest.raises(HTTPError) as err:
+            post(server.address, "/score", ["AAA"])
+        assert err.value.code == 400
+
+        def fail(x):
+            raise RuntimeError("model failed")
+
+        monkeypatch.setattr(server.state.model, "score", fail)
+        with pytest.raises(HTTPError) as err:
+            post(server.address, "/score", dict())
+        assert err.value.code == 500
+
+        monkeypatch.setattr(server, "score_batch", lambda batch: None)
+        with pytest.raises(HTTPError) as err:
+            post(server.address, "/pick", dict())
+        assert err.value.code == 503
+
+        stats = get(server.address, "/stats")
+        assert stats["requests"] == 2
+        assert stats["errors"] == 2
@@ -0,0 +1,58 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import daytradeai.evaluate as evaluate
+import daytradeai.policies as policies
+from daytradeai.shared import SharedDataset
+
+
+@pytest.fixture
+def df_perf():
+    """Next day percent changes for two stocks and an index, plus an int label."""
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2024-01-01", periods=50, freq="D", name="Date")
+    df = pd.DataFrame(
+        rng.normal(size=(50, 3)),
+        index=index,
+        columns=["label_AAA_pdiff_1f", "label_BBB_pdiff_1f", "label_idx_pdiff_1f"],
+    )
+    df["label_AAA"] = (df["label_AAA_pdiff_1f"] > 0).astype(int)
+    return df
+
+
+def make_control_policy(df: pd.DataFrame) -> policies.Policy:
+    return policies.ControlPolicy(index_name="idx")
+
+
+def test_shared_dataset_roundtrip(df_perf):
+    """The shared frame is a zero-copy view with the same values, removed on close."""
+    with SharedDataset.create(df_perf) as dataset:
+        attached = SharedDataset.attach(dataset.spec)
+        df = attached.to_frame()
+        assert np.shares_memory(df["label_AAA_pdiff_1f"].to_numpy(), attached.values)
+        pd.testing.assert_frame_equal(df, df_perf.astype(float), check_freq=False)
+        del df
+        attached.close()
+        name = dataset.spec.name
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=name)
+
+
+def test_parallel_final_values(df_perf):
+    """Runs on worker processes give the same result as in process evaluation."""
+    expected = evaluate.get_asset_final_value(
+        df=df_perf, start_iloc=-30, end_iloc=-1, policy=make_control_policy(df_perf)
+    )
+    with SharedDataset.create(df_perf) as dataset:
+        finals = evaluate.get_asset_final_values_parallel(
+            dataset=dataset,
+            start_iloc=-30,
+            end_iloc=-1,
+            make_policy=make_control_policy,
+            num_runs=4,
+            num_workers=2,
+        )
+    assert finals == pytest.approx([expected] * 4)
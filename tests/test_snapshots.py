@@ -0,0 +1,123 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import daytradeai.snapshots as snapshots
+from daytradeai.preprocess import load_preprocessd
+from daytradeai.snapshots import commit_snapshot, list_versions, load_snapshot
+
+
+@pytest.fixture
+def snapshot_cfg(tmp_path):
+    """Preprocess config with a snapshot store in a temporary directory."""
+    return dict(
+        data_dir=str(tmp_path), snapshots=dict(compact_every=3, retain_versions=4)
+    )
+
+
+@pytest.fixture
+def daily_frames():
+    """Preprocessed frames for consecutive days, each adds a row and fills the label of
+    the previous last row, like the shift(-1) labels do."""
+    rng = np.random.default_rng(2)
+    index = pd.date_range("2024-01-01", periods=30, freq="D")
+    full = pd.DataFrame(dict(AAA=rng.normal(size=30), label_AAA=rng.normal(size=30)))
+    full.index = index
+    frames = []
+    for num_rows in range(20, 27):
+        df = full.iloc[:num_rows].copy()
+        df.iloc[-1, 1] = np.nan
+        frames.append(df)
+    return frames
+
+
+def test_snapshot_versions_rebuild(snapshot_cfg, daily_frames):
+    """Each retained version loads as committed, deltas only hold new and changed rows."""
+    for df in daily_frames:
+        commit_snapshot(df=df, cfg=snapshot_cfg)
+    versions = list_versions(snapshot_cfg)
+    assert len(versions) == 4
+    expected = {df.index.max().strftime("%Y-%m-%d"): df for df in daily_frames}
+    for version in versions:
+        df = load_snapshot(cfg=snapshot_cfg, version=version)
+        pd.testing.assert_frame_equal(df, expected[version], check_freq=False)
+    pd.testing.assert_frame_equal(
+        load_snapshot(cfg=snapshot_cfg), daily_frames[-1], check_freq=False
+    )
+
+    store_dir = os.path.join(snapshot_cfg["data_dir"], "snapshots")
+    deltas = glob.glob(os.path.join(store_dir, "delta-*.parquet"))
+    assert deltas and all(len(pd.read_parquet(fname)) == 2 for fname in deltas)
+    # 7 commits with compaction every 3 files: bases at commits 0, 3 and 6, the last 4
+    # versions only need the last two
+    assert len(glob.glob(os.path.join(store_dir, "base-*.parquet"))) == 2
+
+
+def test_snapshot_recommit_same_day(snapshot_cfg, daily_frames):
+    """Committing the same day again replaces that version."""
+    commit_snapshot(df=daily_frames[0], cfg=snapshot_cfg)
+    df = daily_frames[0].copy()
+    df.iloc[3, 0] = 100.0
+    commit_snapshot(df=df, cfg=snapshot_cfg)
+    assert len(list_versions(snapshot_cfg)) == 1
+    pd.testing.assert_frame_equal(load_snapshot(cfg=snapshot_cfg), df, check_freq=False)
+
+
+def test_load_newest_source(snapshot_cfg, daily_frames):
+    """A newer part directory wins over an older snapshot, and the other way around."""
+    commit_snapshot(df=daily_frames[0], cfg=snapshot_cfg)
+    newer = daily_frames[2]
+    part_dir = os.path.join(
+        snapshot_cfg["data_dir"], newer.index.max().strftime("%Y-%m-%d")
+    )
+    os.makedirs(part_dir)
+    newer.to_parquet(os.path.join(part_dir, "part-00000.parquet"))
+    pd.testing.assert_frame_equal(load_preprocessd(snapshot_cfg), newer, check_freq=False)
+
+    commit_snapshot(df=daily_frames[4], cfg=snapshot_cfg)
+    pd.testing.assert_frame_equal(
+        load_preprocessd(snapshot_cfg, columns=["AAA"]),
+        daily_frames[4][["AAA"]],
+        check_freq=False,
+    )
+
+
+def test_snapshot_crash_before_latest(snapshot_cfg, daily_frames, monkeypatch):
+    """A crash after the manifest is saved but before latest.parquet is replaced loses no
+    rows: the latest version is rebuilt from its chain, and so is every later version. In
+    the first commit there is no latest.parquet yet."""
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshots, "write_latest", crash)
+        with pytest.raises(KeyboardInterrupt):
+            commit_snapshot(df=daily_frames[0], cfg=snapshot_cfg)
+    assert not os.path.exists(snapshots.get_latest_path(snapshot_cfg))
+    pd.testing.assert_frame_equal(
+        load_preprocessd(snapshot_cfg), daily_frames[0], check_freq=False
+    )
+
+    commit_snapshot(df=daily_frames[0], cfg=snapshot_cfg)
+    changed = daily_frames[1].copy()
+    changed.iloc[2, 0] = 100.0  # only in this version
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshots, "write_latest", crash)
+        with pytest.raises(KeyboardInterrupt):
+            commit_snapshot(df=changed, cfg=snapshot_cfg)
+    pd.testing.assert_frame_equal(
+        load_preprocessd(snapshot_cfg), changed, check_freq=False
+    )
+
+    later = daily_frames[2].copy()
+    later.iloc[2, 0] = 100.0
+    commit_snapshot(df=later, cfg=snapshot_cfg)
+    for df in [changed, later]:
+        version = df.index.max().strftime("%Y-%m-%d")
+        pd.testing.assert_frame_equal(
+            load_snapshot(cfg=snapshot_cfg, version=version), df, check_freq=False
+        )
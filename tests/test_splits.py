@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from daytradeai.splits import (
+    SplitData,
+    get_max_lookback,
+    get_purged_kfold_folds,
+    get_walk_forward_folds,
+)
+
+
+@pytest.fixture
+def df_split():
+    rng = np.random.default_rng(0)
+    num_rows = 100
+    df = pd.DataFrame(index=pd.date_range("2024-01-01", periods=num_rows, freq="D"))
+    for ticker in ["AAA", "BBB"]:
+        df[f"label_{ticker}_pdiff_1f"] = rng.normal(size=num_rows)
+        df[f"label_{ticker}"] = (df[f"label_{ticker}_pdiff_1f"] > 0).astype(int)
+        df[f"{ticker}_pdiff_0d_1d"] = rng.normal(size=num_rows)
+    return df
+
+
+def test_walk_forward_folds():
+    """Test windows tile the end of the data, training stops label_horizon days before."""
+    folds = get_walk_forward_folds(
+        num_rows=100, num_folds=4, test_size=20, max_train_size=30
+    )
+    assert [fold.test for fold in folds] == [
+        slice(20, 40),
+        slice(40, 60),
+        slice(60, 80),
+        slice(80, 100),
+    ]
+    assert folds[0].train == (slice(0, 19),)
+    assert folds[-1].train == (slice(49, 79),)
+    assert folds[-1].get_test_ilocs() == (80, 99)
+    folds = get_walk_forward_folds(100, num_folds=5, test_size=20, min_train_size=10)
+    assert len(folds) == 4
+
+
+def test_purged_kfold_views(df_split):
+    """Purge and embargo gaps around every test window, all arrays are views."""
+    embargo = get_max_lookback({0: [1, 5], 1: [1]})
+    assert embargo == 5
+    folds = get_purged_kfold_folds(num_rows=100, num_folds=4, embargo=embargo)
+    assert folds[0].train == (slice(30, 100),)
+    assert folds[1].train == (slice(0, 24), slice(55, 100))
+    assert folds[3].train == (slice(0, 74),)
+
+    data = SplitData(
+        df_split,
+        tickers=["AAA", "BBB"],
+        feature_cols=["AAA_pdiff_0d_1d", "BBB_pdiff_0d_1d"],
+    )
+    for (trains, test), fold in zip(data.iter_folds(folds), folds):
+        for view in trains + [test]:
+            for arr, base in [
+                (view.x, data.x),
+                (view.y, data.y),
+                (view.returns, data.returns),
+            ]:
+                assert arr.flags.c_contiguous
+                assert np.shares_memory(arr, base)
+        np.testing.assert_array_equal(
+            test.returns,
+            df_split[["label_AAA_pdiff_1f", "label_BBB_pdiff_1f"]].iloc[fold.test],
+        )
+        assert sum(len(view.index) for view in trains) == fold.num_train